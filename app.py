@@ -2,23 +2,35 @@
 # 📁 app.py (Full version with kit checker restored)
 # -------------------------
 import streamlit as st
-import pandas as pd
 import io
+import pandas as pd
 import time
 from datetime import datetime, timedelta
-from collections import defaultdict
-from shipstation import get_orders
-from sheet_loader import (
-    load_kits_from_sheets,
-    load_inventory_from_sheets,
-    update_inventory_quantity,
-    load_all_inventory_and_kit_skus
+from sheet_loader import get_inventory_sheet
+import data_cache
+import inventory_ledger
+import fulfillment_worker
+import profiling
+from demand_rollup import load_velocity
+from forecast import load_forecasts
+from fulfillment import (
+    VIEW_MODES,
+    PAGE_SIZES,
+    rollup_view,
+    get_kit_names,
+    build_fulfillment_table,
+    search_table,
+    get_export_formats,
+    export_table
 )
 from streamlit_autorefresh import st_autorefresh
 
 # === Session Settings ===
 SESSION_TIMEOUT = 60 * 60
 
+# 🩺 Opt-in profiling (PROFILE env var or `streamlit run app.py -- --profile`), one profile per rerun
+profiling.configure_once()
+
 def password_gate():
     st.title("🔒 Secure Dashboard Login")
     with st.form("login_form"):
@@ -37,211 +49,214 @@ def logout():
     st.session_state["auth_time"] = 0
     st.rerun()
 
-now = time.time()
-auth_time = st.session_state.get("auth_time", 0)
-session_age = now - auth_time
-if not st.session_state.get("authenticated", False) or session_age > SESSION_TIMEOUT:
-    st.session_state["authenticated"] = False
-    password_gate()
-    st.stop()
-
-with st.sidebar:
-    if st.session_state.get("authenticated", False):
-        if st.button("🚪 Logout"):
-            logout()
-        # 🔄 Manual Refresh Button (moved under logout)
-        if st.button("🔄 Refresh Inventory Now"):
-            st.session_state["inventory"] = load_inventory_from_sheets()
-
-st_autorefresh(interval=5 * 60 * 1000, key="inventory_autorefresh")
-
-kits = load_kits_from_sheets()
-inventory = load_inventory_from_sheets()
-all_skus = load_all_inventory_and_kit_skus()
-
-kit_names = {}
-for kit_sku, components in kits.items():
-    for comp in components:
-        if "kit_name" in comp:
-            kit_names[kit_sku] = comp["kit_name"]
-            break
-    if kit_sku not in kit_names:
-        kit_names[kit_sku] = kit_sku
-
-st.sidebar.header("🗓️ Filter Orders by Date")
-default_start = datetime.now().date() - timedelta(days=14)
-default_end = datetime.now().date()
-start_date = st.sidebar.date_input("Start Date", default_start, key="filter_start_date")
-end_date = st.sidebar.date_input("End Date", default_end, key="filter_end_date")
-
-st.sidebar.markdown("---")
-view_mode = st.sidebar.selectbox("📊 Select View Mode", ["Stock Components View", "Ordered SKUs View"], key="view_mode_selector")
-if "_last_view_mode" not in st.session_state:
-    st.session_state["_last_view_mode"] = view_mode
-elif view_mode != st.session_state["_last_view_mode"]:
-    st.session_state["_last_view_mode"] = view_mode
-    st.rerun()
+def record_inventory_event(sku, kind, qty):
+    """Records the change in the ledger; the sheet is written back a few seconds later in one batch."""
+    inventory_ledger.record_event(sku, kind, qty, source="dashboard")
+    inventory_ledger.schedule_flush(get_inventory_sheet)
+    fulfillment_worker.request_refresh()
 
-st.sidebar.subheader("Inventory Controls")
-
-# 🔎 Kit Component Checker (Restored)
-st.sidebar.markdown("---")
-st.sidebar.subheader("Check Kit Components")
-kit_sku = st.sidebar.text_input("Enter SKU to check components").strip().upper()
-if kit_sku:
-    if kit_sku in kits:
-        st.sidebar.success(f"{kit_sku} is a kit. Components:")
-        rows = []
-        for comp in kits[kit_sku]:
-            comp_sku = comp.get("sku", "").strip().upper()
-            qty = comp.get("qty", "")
-            name = inventory.get(comp_sku, {}).get("name", "")
-            rows.append({"Component SKU": comp_sku, "Quantity": qty, "Name": name})
-        st.sidebar.dataframe(pd.DataFrame(rows))
-    else:
-        used_in = []
-        for parent_kit, components in kits.items():
-            for comp in components:
-                if comp.get("sku", "").strip().upper() == kit_sku:
-                    used_in.append({
-                        "Kit SKU": parent_kit,
-                        "Kit Name": kit_names.get(parent_kit, parent_kit),
-                        "Quantity Used": comp.get("qty", "")
-                    })
-        if used_in:
-            st.sidebar.info(f"{kit_sku} is not a kit but is used in the following kits:")
-            st.sidebar.dataframe(pd.DataFrame(used_in))
-        else:
-            st.sidebar.info(f"{kit_sku} is not a kit and not used in any kit.")
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_velocity(view):
+    return load_velocity(view)
 
-st.markdown("# 🧾 SKU Fulfillment Summary")
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_forecasts():
+    return load_forecasts()
 
-inventory_levels = st.session_state.get("inventory", inventory)
+# The whole rerun runs inside try/finally so its profile is finished on this thread even
+# when st.stop()/st.rerun() or an error ends the script early
+_profile_session = profiling.start("app_rerun")
+try:
+    now = time.time()
+    auth_time = st.session_state.get("auth_time", 0)
+    session_age = now - auth_time
+    if not st.session_state.get("authenticated", False) or session_age > SESSION_TIMEOUT:
+        st.session_state["authenticated"] = False
+        password_gate()
+        st.stop()
 
-# 📦 Add Inventory
-with st.expander("➕ Add Received Inventory to Stock", expanded=False):
-    with st.form("inventory_update_form"):
-        sku_input = st.text_input("Enter SKU").strip().upper()
-        qty_input = st.number_input("Enter quantity received", step=1, min_value=1)
-        submitted = st.form_submit_button("Submit")
-        if submitted:
-            old_qty = inventory.get(sku_input, {}).get("stock", 0)
-            result = update_inventory_quantity(sku_input, qty_input)
-            if result["success"]:
-                st.success(f"✅ {qty_input} units added to {sku_input}. Updated from {old_qty} → {result['new_qty']}")
-                st.rerun()
-            else:
-                st.error(f"❌ SKU '{sku_input}' not found in the inventory sheet.")
-
-# 📦 Subtract Inventory
-with st.expander("➖ Subtract Inventory Manually", expanded=False):
-    with st.form("inventory_subtract_form"):
-        sku_input = st.text_input("Enter SKU to subtract").strip().upper()
-        qty_input = st.number_input("Enter quantity to subtract", step=1, min_value=1)
-        submitted = st.form_submit_button("Submit")
-        if submitted:
-            old_qty = inventory.get(sku_input, {}).get("stock", 0)
-            result = update_inventory_quantity(sku_input, -qty_input)
-            if result["success"]:
-                st.success(f"✅ {qty_input} units subtracted from {sku_input}. Updated from {old_qty} → {result['new_qty']}")
-                st.rerun()
-            else:
-                st.error(f"❌ SKU '{sku_input}' not found in the inventory sheet.")
-
-# 📦 Set Inventory Value
-with st.expander("✏️ Set Inventory Quantity Manually", expanded=False):
-    with st.form("inventory_set_form"):
-        sku_input = st.text_input("Enter SKU to overwrite").strip().upper()
-        qty_input = st.number_input("Set stock quantity", min_value=0.0, step=1.0)
-        password_check = st.text_input("Re-enter password", type="password")
-        submitted = st.form_submit_button("Set Quantity")
-        if submitted:
-            if password_check != st.secrets["auth"]["set_inventory_password"]:
-                st.error("❌ Incorrect password. Quantity not changed.")
+    with st.sidebar:
+        if st.session_state.get("authenticated", False):
+            if st.button("🚪 Logout"):
+                logout()
+            # 🔄 Manual Refresh Button (moved under logout)
+            if st.button("🔄 Refresh Inventory Now"):
+                if data_cache.refresh_inventory_async():
+                    st.info("Refreshing inventory in the background...")
+            if data_cache.is_refreshing():
+                st.caption("⏳ Inventory refresh in progress")
+
+    st_autorefresh(interval=5 * 60 * 1000, key="inventory_autorefresh")
+
+    kits = data_cache.get_kits()
+    inventory = data_cache.get_inventory()
+    all_skus = data_cache.get_all_skus()
+
+    kit_names = get_kit_names(kits)
+    fulfillment_worker.ensure_started()
+
+    st.sidebar.header("🗓️ Filter Orders by Date")
+    default_start = datetime.now().date() - timedelta(days=14)
+    default_end = datetime.now().date()
+    start_date = st.sidebar.date_input("Start Date", default_start, key="filter_start_date")
+    end_date = st.sidebar.date_input("End Date", default_end, key="filter_end_date")
+
+    st.sidebar.markdown("---")
+    view_mode = st.sidebar.selectbox("📊 Select View Mode", VIEW_MODES, key="view_mode_selector")
+    if "_last_view_mode" not in st.session_state:
+        st.session_state["_last_view_mode"] = view_mode
+    elif view_mode != st.session_state["_last_view_mode"]:
+        st.session_state["_last_view_mode"] = view_mode
+        st.rerun()
+
+    st.sidebar.subheader("Inventory Controls")
+
+    # 🔎 Kit Component Checker (Restored)
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Check Kit Components")
+    kit_sku = st.sidebar.text_input("Enter SKU to check components").strip().upper()
+    if kit_sku:
+        if kit_sku in kits:
+            st.sidebar.success(f"{kit_sku} is a kit. Components:")
+            rows = []
+            for comp in kits[kit_sku]:
+                comp_sku = comp.get("sku", "").strip().upper()
+                qty = comp.get("qty", "")
+                name = inventory.get(comp_sku, {}).get("name", "")
+                rows.append({"Component SKU": comp_sku, "Quantity": qty, "Name": name})
+            st.sidebar.dataframe(pd.DataFrame(rows))
+        else:
+            used_in = []
+            for parent_kit, components in kits.items():
+                for comp in components:
+                    if comp.get("sku", "").strip().upper() == kit_sku:
+                        used_in.append({
+                            "Kit SKU": parent_kit,
+                            "Kit Name": kit_names.get(parent_kit, parent_kit),
+                            "Quantity Used": comp.get("qty", "")
+                        })
+            if used_in:
+                st.sidebar.info(f"{kit_sku} is not a kit but is used in the following kits:")
+                st.sidebar.dataframe(pd.DataFrame(used_in))
             else:
-                old_qty = inventory.get(sku_input, {}).get("stock", 0.0)
-                diff = qty_input - old_qty
-                result = update_inventory_quantity(sku_input, diff)
-                if result["success"]:
-                    st.success(f"[UPDATED] {sku_input}: Overwrote from {old_qty} → {qty_input}.")
+                st.sidebar.info(f"{kit_sku} is not a kit and not used in any kit.")
+
+    st.markdown("# 🧾 SKU Fulfillment Summary")
+
+    inventory_levels = inventory
+
+    # 📦 Add Inventory
+    with st.expander("➕ Add Received Inventory to Stock", expanded=False):
+        with st.form("inventory_update_form"):
+            sku_input = st.text_input("Enter SKU").strip().upper()
+            qty_input = st.number_input("Enter quantity received", step=1, min_value=1)
+            submitted = st.form_submit_button("Submit")
+            if submitted:
+                if sku_input in inventory:
+                    old_qty = inventory[sku_input]["stock"]
+                    record_inventory_event(sku_input, "receive", qty_input)
+                    st.success(f"✅ {qty_input} units added to {sku_input}. Updated from {old_qty} → {old_qty + qty_input}")
                     st.rerun()
                 else:
                     st.error(f"❌ SKU '{sku_input}' not found in the inventory sheet.")
 
-orders = get_orders()
-filtered_orders = []
-for order in orders:
-    payment_date_str = order.get("paymentDate")
-    if not payment_date_str:
-        continue
-    try:
-        payment_date = datetime.strptime(payment_date_str.split("T")[0], "%Y-%m-%d").date()
-        if start_date <= payment_date <= end_date:
-            filtered_orders.append(order)
-    except:
-        continue
-
-if not filtered_orders:
-    st.warning("No orders found in the selected date range.")
-    st.stop()
-
-st.write("🔎 Filter range:", start_date, "to", end_date)
-
-# Demand calculation
-def get_sku_totals(orders, kits, inventory, separate_virtual=False):
-    exploded = defaultdict(lambda: {"total": 0.0, "from_kits": 0.0, "standalone": 0.0})
-    for order in orders:
-        for item in order.get("items", []):
-            sku = (item.get("sku") or '').strip().upper()
-            qty = item.get("quantity", 0)
-            if sku in kits:
-                if separate_virtual:
-                    exploded[sku]["total"] += qty
-                    exploded[sku]["standalone"] += qty
+    # 📦 Subtract Inventory
+    with st.expander("➖ Subtract Inventory Manually", expanded=False):
+        with st.form("inventory_subtract_form"):
+            sku_input = st.text_input("Enter SKU to subtract").strip().upper()
+            qty_input = st.number_input("Enter quantity to subtract", step=1, min_value=1)
+            submitted = st.form_submit_button("Submit")
+            if submitted:
+                if sku_input in inventory:
+                    old_qty = inventory[sku_input]["stock"]
+                    record_inventory_event(sku_input, "adjust", -qty_input)
+                    st.success(f"✅ {qty_input} units subtracted from {sku_input}. Updated from {old_qty} → {old_qty - qty_input}")
+                    st.rerun()
                 else:
-                    for comp in kits[sku]:
-                        comp_sku = comp["sku"].strip().upper()
-                        exploded[comp_sku]["total"] += qty * float(comp["qty"])
-                        exploded[comp_sku]["from_kits"] += qty * float(comp["qty"])
-                if sku in inventory:
-                    exploded[sku]["total"] += qty
-                    exploded[sku]["standalone"] += qty
-            else:
-                exploded[sku]["total"] += qty
-                exploded[sku]["standalone"] += qty
-    return exploded
-
-sku_totals = get_sku_totals(filtered_orders, kits, inventory_levels, separate_virtual=(view_mode == "Ordered SKUs View"))
-
-display_skus = list(inventory_levels.keys()) if view_mode == "Stock Components View" else sorted(all_skus)
-
-rows = []
-for sku in display_skus:
-    info = inventory_levels.get(sku, {"stock": 0.0, "name": sku})
-    product_name = info.get("name") or kit_names.get(sku, sku)
-    total = sku_totals.get(sku, {}).get("total", 0.0)
-    from_kits = sku_totals.get(sku, {}).get("from_kits", 0.0)
-    standalone = sku_totals.get(sku, {}).get("standalone", 0.0)
-    stock = info.get("stock", 0.0)
-    running = stock - total
-
-    rows.append({
-        "Is Kit": "✅" if sku in kits else "",
-        "SKU": sku,
-        "Product Name": product_name,
-        "Total Quantity Needed": round(total, 2),
-        "From Kits": round(from_kits, 2),
-        "Standalone Orders": round(standalone, 2),
-        "Stock On Hand": round(stock, 2),
-        "Qty Short": round(max(total - stock, 0), 2),
-        "Running Inventory": round(max(running, 0), 2)
-    })
-
-df = pd.DataFrame(rows)
-df = df.sort_values("Total Quantity Needed", ascending=False).reset_index(drop=True)
-
-st.dataframe(df, use_container_width=True)
-
-csv_buffer = io.StringIO()
-df.to_csv(csv_buffer, index=False)
-st.download_button("📅 Download CSV", csv_buffer.getvalue(), "sku_fulfillment_summary.csv", "text/csv")
+                    st.error(f"❌ SKU '{sku_input}' not found in the inventory sheet.")
+
+    # 📦 Set Inventory Value
+    with st.expander("✏️ Set Inventory Quantity Manually", expanded=False):
+        with st.form("inventory_set_form"):
+            sku_input = st.text_input("Enter SKU to overwrite").strip().upper()
+            qty_input = st.number_input("Set stock quantity", min_value=0.0, step=1.0)
+            password_check = st.text_input("Re-enter password", type="password")
+            submitted = st.form_submit_button("Set Quantity")
+            if submitted:
+                if password_check != st.secrets["auth"]["set_inventory_password"]:
+                    st.error("❌ Incorrect password. Quantity not changed.")
+                elif sku_input in inventory:
+                    old_qty = inventory[sku_input]["stock"]
+                    # Recorded as an absolute count, so stock shipped meanwhile can't be overwritten by a stale diff
+                    record_inventory_event(sku_input, "set", qty_input)
+                    st.success(f"[UPDATED] {sku_input}: Overwrote from {old_qty} → {qty_input}.")
+                    st.rerun()
+                else:
+                    st.error(f"❌ SKU '{sku_input}' not found in the inventory sheet.")
+
+    # Serve the background worker's precomputed table when it matches this view and range
+    with profiling.timer("app.load_snapshot"):
+        snapshot = fulfillment_worker.load_snapshot(view_mode, start_date, end_date)
+
+    if snapshot is not None:
+        table, snapshot_meta = snapshot
+        order_count = int(snapshot_meta["order_count"])
+    else:
+        # Fallback: build the table in this request and let the worker catch up
+        fulfillment_worker.request_refresh()
+        with profiling.timer("app.order_index"):
+            order_index = data_cache.get_order_index()
+        order_count = order_index.order_count(start_date, end_date)
+        table = None
+
+    if not order_count:
+        st.warning("No orders found in the selected date range.")
+        st.stop()
+
+    st.write("🔎 Filter range:", start_date, "to", end_date)
+
+    if table is None:
+        demand = order_index.demand(start_date, end_date, separate_virtual=(view_mode == "Ordered SKUs View"))
+        velocity = cached_velocity(rollup_view(view_mode))
+        forecasts = cached_forecasts()
+        with profiling.timer("app.build_table"):
+            table = build_fulfillment_table(demand, kits, inventory_levels, all_skus, view_mode, velocity, forecasts)
+
+    # 🔍 Search, filter and paginate on the server so only one page is sent to the browser
+    search_col, short_col, size_col = st.columns([3, 1, 1])
+    search = search_col.text_input("Search SKU or product name", key="table_search")
+    only_short = short_col.checkbox("Only short", key="table_only_short")
+    page_size = size_col.selectbox("Rows per page", PAGE_SIZES, index=1, key="table_page_size")
+
+    with profiling.timer("app.search_table"):
+        results = search_table(table, search, only_short)
+    page_count = max((results.num_rows + page_size - 1) // page_size, 1)
+    if st.session_state.get("table_page", 1) > page_count:
+        st.session_state["table_page"] = 1
+    page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key="table_page")
+    st.caption(f"{results.num_rows} of {table.num_rows} SKUs · page {page} of {page_count}")
+
+    st.dataframe(results.slice((page - 1) * page_size, page_size), use_container_width=True)
+
+    # 📅 Exports are built only when asked for and kept in session state, so the download button
+    # survives the rerun its own click triggers; changing the view, range or filters drops the file
+    export_formats = get_export_formats()
+    format_col, prepare_col = st.columns([1, 3])
+    export_format = format_col.selectbox("Export format", list(export_formats), key="export_format")
+    export_key = (view_mode, start_date, end_date, search, only_short, export_format)
+    prepared = st.session_state.get("prepared_export")
+    if prepared is not None and prepared["key"] != export_key:
+        del st.session_state["prepared_export"]
+        prepared = None
+    if prepare_col.button("📦 Prepare export"):
+        with io.BytesIO() as sink:
+            export_table(results, export_format, sink)
+            # getvalue() hands over the BytesIO's own buffer rather than copying it, and closing
+            # the sink leaves that bytes object as the only copy of the file
+            prepared = {"key": export_key, "data": sink.getvalue()}
+        st.session_state["prepared_export"] = prepared
+    if prepared is not None:
+        extension, mime = export_formats[export_format]
+        st.download_button(f"📅 Download {export_format}", prepared["data"], f"sku_fulfillment_summary.{extension}", mime)
+finally:
+    profiling.stop(_profile_session)
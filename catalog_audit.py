@@ -0,0 +1,191 @@
+# -----------------------------
+# 📁 catalog_audit.py (Concurrent multi-store SKU audit against the Kit BOMs sheet)
+# -----------------------------
+import csv
+import json
+import logging
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from find_duplicate_skus import fetch_all_products, find_duplicates
+from shopify_sync import load_store_configs
+from sheet_loader import get_gspread_client, load_inventory_from_sheets, load_kits_from_sheets
+
+REPORT_DIR = "reports"
+REPORT_FIELDS = ["Issue", "Store", "SKU", "Product Title", "Variant Title", "Variant ID", "Product ID", "Archived"]
+
+def _submit_crawls(pool, stores):
+    return {
+        store["name"]: pool.submit(fetch_all_products, store["shop_url"], store["access_token"])
+        for store in stores
+    }
+
+def crawl_catalogs(stores):
+    """
+    Crawls every store's catalog at the same time. Returns ({store name: variants},
+    {store name: error}) so one store failing doesn't cost the others their audit.
+    """
+    catalogs, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max(len(stores), 1)) as pool:
+        for name, future in _submit_crawls(pool, stores).items():
+            try:
+                catalogs[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+    return catalogs, errors
+
+def crawl_all(stores, client=None):
+    """
+    Crawls every store's catalog on worker threads while the inventory and kit
+    sheets load on this one; gspread clients aren't thread-safe, so the client
+    never leaves the calling thread. Returns ({store name: variants}, inventory, kits).
+    """
+    client = client or get_gspread_client()
+    with ThreadPoolExecutor(max_workers=max(len(stores), 1)) as pool:
+        catalog_futures = _submit_crawls(pool, stores)
+        inventory = load_inventory_from_sheets(client)
+        kits = load_kits_from_sheets(client)
+        catalogs = {name: future.result() for name, future in catalog_futures.items()}
+    return catalogs, inventory, kits
+
+def sku_map(variants):
+    """The {sku: {"inventory_item_id", "name"}} lookup shopify_sync pushes stock through, built from a crawl."""
+    return {
+        v["sku"]: {
+            "inventory_item_id": v["inventory_item_id"],
+            "name": f"{v['product_title'] or ''} - {v['variant_title'] or ''}".strip(" -")
+        }
+        for v in variants
+        if v["sku"]
+    }
+
+def build_sku_index(catalogs):
+    """{sku: {store name: [variants]}} across every store; variants without a SKU are left out."""
+    index = defaultdict(lambda: defaultdict(list))
+    for store_name, variants in catalogs.items():
+        for v in variants:
+            if v["sku"]:
+                index[v["sku"]][store_name].append(v)
+    return index
+
+def audit(catalogs, inventory, kits):
+    """
+    One pass over the cross-store SKU index. Returns a dict with, per store:
+    duplicate SKUs, sheet SKUs the store doesn't list (what shopify_sync would
+    warn about one by one), and store SKUs missing from the inventory and kit sheets.
+    """
+    index = build_sku_index(catalogs)
+    sheet_skus = set(inventory) | set(kits)
+    stores = list(catalogs)
+
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "stores": {
+            name: {
+                "variants": len(catalogs[name]),
+                "blank_skus": sum(1 for v in catalogs[name] if not v["sku"]),
+                "duplicates": find_duplicates(catalogs[name]),
+                "missing_from_store": [],
+                "missing_from_sheets": {}
+            }
+            for name in stores
+        }
+    }
+
+    for sku in sorted(sheet_skus | set(index)):
+        listed = index.get(sku, {})
+        in_sheets = sku in sheet_skus
+        for name in stores:
+            if in_sheets and name not in listed:
+                report["stores"][name]["missing_from_store"].append(sku)
+            elif not in_sheets and name in listed:
+                report["stores"][name]["missing_from_sheets"][sku] = listed[name]
+    return report
+
+def summarize(report):
+    return {
+        name: {
+            "variants": store["variants"],
+            "blank_skus": store["blank_skus"],
+            "duplicates": len(store["duplicates"]),
+            "missing_from_store": len(store["missing_from_store"]),
+            "missing_from_sheets": len(store["missing_from_sheets"])
+        }
+        for name, store in report["stores"].items()
+    }
+
+def audit_before_sync(stores, inventory, kits, report_dir=REPORT_DIR):
+    """
+    Audits every store against the sheets a sync already loaded and writes the report.
+    Returns {store name: sku map} for each store that crawled, so the sync pushes
+    through these catalogs instead of crawling them a second time.
+    """
+    catalogs, errors = crawl_catalogs(stores)
+    for name, e in errors.items():
+        logging.error(f"[AUDIT] Could not crawl {name}: {e}")
+    report = audit(catalogs, inventory, kits)
+    export_report(report, report_dir)
+    for name, counts in summarize(report).items():
+        logging.info(
+            f"[AUDIT] {name}: {counts['duplicates']} duplicate SKU(s), {counts['missing_from_store']} sheet SKU(s) "
+            f"not in store, {counts['missing_from_sheets']} store SKU(s) not in sheets"
+        )
+    return {name: sku_map(variants) for name, variants in catalogs.items()}
+
+def export_report(report, report_dir=REPORT_DIR):
+    """Writes catalog_audit.csv (one row per finding) and catalog_audit.json. Returns both paths."""
+    os.makedirs(report_dir, exist_ok=True)
+    csv_path = os.path.join(report_dir, "catalog_audit.csv")
+    json_path = os.path.join(report_dir, "catalog_audit.json")
+
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(REPORT_FIELDS)
+        for name, store in report["stores"].items():
+            for issue, entries in (("Duplicate", store["duplicates"]), ("Missing From Sheets", store["missing_from_sheets"])):
+                for sku, variants in entries.items():
+                    for v in variants:
+                        writer.writerow([
+                            issue, name, sku, v["product_title"], v["variant_title"],
+                            v["variant_id"], v["product_id"], "Yes" if v["archived"] else "No"
+                        ])
+            for sku in store["missing_from_store"]:
+                writer.writerow(["Missing From Store", name, sku, "", "", "", "", ""])
+
+    with open(json_path, mode="w", encoding="utf-8") as f:
+        json.dump({
+            "generated_at": report["generated_at"],
+            "summary": summarize(report),
+            "stores": {
+                name: {
+                    "duplicates": sorted(store["duplicates"]),
+                    "missing_from_store": store["missing_from_store"],
+                    "missing_from_sheets": sorted(store["missing_from_sheets"])
+                }
+                for name, store in report["stores"].items()
+            }
+        }, f, indent=2)
+
+    return csv_path, json_path
+
+if __name__ == "__main__":
+    stores = load_store_configs()
+    if not stores:
+        print("❌ No valid Shopify store credentials found in .env")
+        sys.exit(1)
+
+    print(f"🔍 Crawling {len(stores)} store(s) and loading sheets...")
+    catalogs, inventory, kits = crawl_all(stores)
+    report = audit(catalogs, inventory, kits)
+
+    for name, counts in summarize(report).items():
+        print(
+            f"🏬 {name}: {counts['variants']} variants | {counts['duplicates']} duplicate SKUs | "
+            f"{counts['missing_from_store']} sheet SKUs not in store | "
+            f"{counts['missing_from_sheets']} store SKUs not in sheets | {counts['blank_skus']} blank SKUs"
+        )
+
+    csv_path, json_path = export_report(report)
+    print(f"📁 Saved audit to {csv_path} and {json_path}")
@@ -0,0 +1,92 @@
+# -----------------------------
+# 📁 config.py (Credentials and settings from .env or Streamlit secrets, without importing Streamlit)
+# -----------------------------
+import json
+import os
+import sys
+import threading
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+GSPREAD_KEY_FILE = "gspread_key.json"
+
+_lock = threading.Lock()
+_env_loaded = False
+_secrets = None
+
+def load_env():
+    """Loads .env into os.environ once, on first use rather than at import."""
+    global _env_loaded
+    with _lock:
+        if _env_loaded:
+            return
+        _env_loaded = True
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+def _read_secrets_file(path):
+    try:
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    except ImportError:
+        import toml
+        with open(path, encoding="utf-8") as f:
+            return toml.load(f)
+
+def get_secrets():
+    """
+    Streamlit secrets as a plain dict. Inside a running app (Streamlit already
+    imported) st.secrets is used; everywhere else .streamlit/secrets.toml is read
+    directly, so headless jobs never pay for importing Streamlit.
+    """
+    global _secrets
+    if _secrets:
+        return _secrets
+    secrets = {}
+    if "streamlit" in sys.modules:
+        try:
+            secrets = sys.modules["streamlit"].secrets.to_dict()
+        except Exception:
+            secrets = {}
+    if not secrets and os.path.exists(SECRETS_PATH):
+        try:
+            secrets = _read_secrets_file(SECRETS_PATH)
+        except Exception:
+            secrets = {}
+    # Only a successful read is cached, so secrets that appear later are still picked up
+    if secrets:
+        _secrets = secrets
+    return secrets
+
+def get(name, default=None):
+    """A setting from the environment (.env included), falling back to a top-level secret."""
+    load_env()
+    value = os.getenv(name)
+    if value is not None:
+        return value
+    return get_secrets().get(name, default)
+
+def get_bool(name, default=False):
+    value = get(name)
+    if value is None:
+        return default
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+def require(*names):
+    """Values for every name, or a ValueError listing the ones that are missing."""
+    values = [get(name) for name in names]
+    missing = [name for name, value in zip(names, values) if not value]
+    if missing:
+        raise ValueError(f"Missing {' or '.join(missing)} in .env or Streamlit secrets")
+    return values[0] if len(values) == 1 else values
+
+def get_gspread_key():
+    """The Google service-account key from the gspread_key secret, else gspread_key.json."""
+    key = get_secrets().get("gspread_key")
+    if key:
+        return dict(key)
+    with open(GSPREAD_KEY_FILE) as f:
+        return json.load(f)
@@ -0,0 +1,139 @@
+# -----------------------------
+# 📁 data_cache.py (Process-wide TTL caches shared by every dashboard session)
+# -----------------------------
+import logging
+import threading
+import uuid
+from cachetools import TTLCache
+import inventory_ledger
+from shipstation import get_orders as fetch_orders
+from sheet_loader import load_kits_from_sheets, load_inventory_from_sheets
+from order_index import OrderIndex
+
+KITS_TTL = 15 * 60
+INVENTORY_TTL = 5 * 60
+ORDERS_TTL = 2 * 60
+
+_kits_cache = TTLCache(maxsize=1, ttl=KITS_TTL)
+_inventory_cache = TTLCache(maxsize=1, ttl=INVENTORY_TTL)
+_orders_cache = TTLCache(maxsize=8, ttl=ORDERS_TTL)
+
+_lock = threading.RLock()
+_load_locks = {}
+_refreshing = threading.Event()
+# Bumped whenever a dataset is reloaded or patched, so derived snapshots can tell they're stale
+_versions = {"kits": 0, "inventory": 0, "orders": 0}
+_instance = uuid.uuid4().hex[:8]
+
+def _store(cache, name, key, value, version=None):
+    """
+    Stores a freshly loaded value unless the dataset was invalidated or reloaded since
+    `version` was read, so a slow load never puts back data older than a write. Returns whether it was stored.
+    """
+    with _lock:
+        if version is not None and _versions[name] != version:
+            return False
+        cache[key] = value
+        _versions[name] += 1
+        return True
+
+def data_version():
+    """A stamp that changes whenever any cached dataset or the inventory ledger changes."""
+    ledger_id = inventory_ledger.last_event_id()
+    with _lock:
+        return "{}-k{kits}-i{inventory}-o{orders}-l{}".format(_instance, ledger_id, **_versions)
+
+def _cached(cache, name, key, loader):
+    """
+    Returns cache[key], loading it at most once at a time: sessions that miss
+    together wait for the first loader rather than all hitting the API.
+    """
+    with _lock:
+        if key in cache:
+            return cache[key]
+        load_lock = _load_locks.setdefault((id(cache), key), threading.Lock())
+    with load_lock:
+        with _lock:
+            if key in cache:
+                return cache[key]
+            version = _versions[name]
+        value = loader()
+        _store(cache, name, key, value, version)
+        return value
+
+def get_kits():
+    return _cached(_kits_cache, "kits", "kits", load_kits_from_sheets)
+
+def _load_inventory():
+    # Stamp the read with the ledger position right after it: flushes committed by then are in
+    # the sheet values, anything flushed later is still overlaid
+    inventory = load_inventory_from_sheets()
+    return inventory_ledger.last_event_id(), inventory
+
+def get_inventory():
+    """The cached inventory sheet with ledger events it doesn't reflect yet applied on top."""
+    mark, inventory = _cached(_inventory_cache, "inventory", "inventory", _load_inventory)
+    return inventory_ledger.overlay(inventory, mark=mark)
+
+def get_all_skus():
+    """All SKUs in the inventory or as virtual kits, built from the cached sheets."""
+    return set(get_inventory().keys()) | set(get_kits().keys())
+
+def get_orders(order_status="awaiting_shipment"):
+    return _cached(_orders_cache, "orders", order_status, lambda: fetch_orders(order_status))
+
+_index = {"orders": None, "kits": None, "index": None}
+
+def get_order_index(order_status="awaiting_shipment"):
+    """
+    The payment-date index over the cached orders. Rebuilt only when the orders,
+    kits or the set of inventory SKUs change, not on stock-level changes.
+    """
+    orders = get_orders(order_status)
+    kits = get_kits()
+    inventory = get_inventory()
+    with _lock:
+        index = _index["index"]
+        if _index["orders"] is orders and _index["kits"] is kits and index.matches(inventory):
+            return index
+    index = OrderIndex(orders, kits, inventory)
+    with _lock:
+        _index.update(orders=orders, kits=kits, index=index)
+    return index
+
+def invalidate_inventory():
+    with _lock:
+        _inventory_cache.pop("inventory", None)
+        _versions["inventory"] += 1
+
+def invalidate_orders():
+    with _lock:
+        _orders_cache.clear()
+        _versions["orders"] += 1
+
+def refresh_inventory_async():
+    """
+    Reloads the inventory sheet on a background thread and swaps it in when done.
+    Sessions keep reading the current copy meanwhile. Returns False if a refresh is already running.
+    """
+    with _lock:
+        if _refreshing.is_set():
+            return False
+        _refreshing.set()
+
+    def worker():
+        try:
+            with _lock:
+                version = _versions["inventory"]
+            if not _store(_inventory_cache, "inventory", "inventory", _load_inventory(), version):
+                logging.info("[CACHE] Inventory changed during the background refresh; kept the newer copy")
+        except Exception as e:
+            logging.error(f"[ERROR] Background inventory refresh failed: {e}")
+        finally:
+            _refreshing.clear()
+
+    threading.Thread(target=worker, name="inventory-refresh", daemon=True).start()
+    return True
+
+def is_refreshing():
+    return _refreshing.is_set()
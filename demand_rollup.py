@@ -0,0 +1,172 @@
+# -----------------------------
+# 📁 demand_rollup.py (Daily per-SKU demand rollups, velocity and days-of-cover)
+# -----------------------------
+import os
+import sqlite3
+from datetime import date, timedelta
+from order_store import DB_PATH, init_order_lines
+
+VIEWS = ("component", "ordered")
+VELOCITY_WINDOWS = (7, 30, 90)
+COVER_WINDOW = 30
+
+def init_rollups(conn):
+    c = conn.cursor()
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS daily_sku_demand (
+            view TEXT NOT NULL,
+            sku TEXT NOT NULL,
+            day TEXT NOT NULL,
+            qty REAL NOT NULL,
+            PRIMARY KEY (view, sku, day)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_daily_sku_demand_view_day ON daily_sku_demand (view, day)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    conn.commit()
+
+def _get_watermark(conn):
+    row = conn.execute("SELECT value FROM rollup_state WHERE name = 'order_lines_rowid'").fetchone()
+    return row[0] if row else 0
+
+def refresh_rollups(conn):
+    """
+    Brings daily_sku_demand up to date with order_lines.
+
+    The "component" view sums what was deducted from stock (kits exploded);
+    the "ordered" view sums what customers ordered (kits counted as the kit SKU).
+    Each (view, sku, day) touched by lines added since the last refresh, or by lines
+    a re-sync replaced, is recomputed from order_lines rather than added to, so a
+    re-synced order is never counted twice. Returns the number of new order lines rolled up.
+    """
+    init_order_lines(conn)
+    init_rollups(conn)
+
+    low = _get_watermark(conn)
+    high = max(conn.execute("SELECT COALESCE(MAX(id), 0) FROM order_lines").fetchone()[0], low)
+    replaced_high = conn.execute("SELECT COALESCE(MAX(id), 0) FROM order_lines_replaced").fetchone()[0]
+    if high <= low and not replaced_high:
+        return 0
+
+    with conn:
+        conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS rollup_keys (
+                view TEXT, sku TEXT, day TEXT, PRIMARY KEY (view, sku, day)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("DELETE FROM temp.rollup_keys")
+        conn.execute("""
+            INSERT OR IGNORE INTO temp.rollup_keys (view, sku, day)
+            SELECT 'component', sku, ship_date FROM order_lines WHERE id > ? AND id <= ?
+            UNION
+            SELECT 'ordered', CASE WHEN source = 'kit' THEN kit_sku ELSE sku END, ship_date
+            FROM order_lines WHERE id > ? AND id <= ?
+            UNION
+            SELECT 'component', sku, ship_date FROM order_lines_replaced WHERE id <= ?
+            UNION
+            SELECT 'ordered', CASE WHEN source = 'kit' THEN kit_sku ELSE sku END, ship_date
+            FROM order_lines_replaced WHERE id <= ?
+        """, (low, high, low, high, replaced_high, replaced_high))
+        conn.execute("""
+            DELETE FROM daily_sku_demand
+            WHERE (view, sku, day) IN (SELECT view, sku, day FROM temp.rollup_keys)
+        """)
+        conn.execute("""
+            INSERT INTO daily_sku_demand (view, sku, day, qty)
+            SELECT 'component', l.sku, l.ship_date, SUM(l.qty)
+            FROM temp.rollup_keys k
+            JOIN order_lines l ON l.sku = k.sku AND l.ship_date = k.day
+            WHERE k.view = 'component'
+            GROUP BY l.sku, l.ship_date
+        """)
+        conn.execute("""
+            INSERT INTO daily_sku_demand (view, sku, day, qty)
+            SELECT 'ordered', sku, day, SUM(qty) FROM (
+                SELECT l.sku, l.ship_date AS day, l.qty
+                FROM temp.rollup_keys k
+                JOIN order_lines l ON l.sku = k.sku AND l.ship_date = k.day
+                WHERE k.view = 'ordered' AND l.source = 'standalone'
+                UNION ALL
+                SELECT l.kit_sku, l.ship_date, MAX(l.kit_qty)
+                FROM temp.rollup_keys k
+                JOIN order_lines l ON l.kit_sku = k.sku AND l.ship_date = k.day
+                WHERE k.view = 'ordered' AND l.source = 'kit'
+                GROUP BY l.order_id, l.kit_sku, l.ship_date
+            )
+            GROUP BY sku, day
+        """)
+        conn.execute("DELETE FROM order_lines_replaced WHERE id <= ?", (replaced_high,))
+        conn.execute("""
+            INSERT INTO rollup_state (name, value) VALUES ('order_lines_rowid', ?)
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        """, (high,))
+
+    count = conn.execute(
+        "SELECT COUNT(*) FROM order_lines WHERE id > ? AND id <= ?", (low, high)
+    ).fetchone()[0]
+    return count
+
+def rebuild_rollups(conn):
+    """Drops all rollups and rebuilds them from the full order_lines history."""
+    init_rollups(conn)
+    with conn:
+        conn.execute("DELETE FROM daily_sku_demand")
+        conn.execute("DELETE FROM rollup_state WHERE name = 'order_lines_rowid'")
+    return refresh_rollups(conn)
+
+def get_daily_demand(conn, view, start_date, end_date):
+    """Returns [(sku, day, qty), ...] for the view between start_date and end_date (inclusive)."""
+    cur = conn.execute("""
+        SELECT sku, day, qty FROM daily_sku_demand
+        WHERE view = ? AND day BETWEEN ? AND ?
+        ORDER BY sku, day
+    """, (view, start_date.isoformat(), end_date.isoformat()))
+    return cur.fetchall()
+
+def get_velocity(conn, view, windows=VELOCITY_WINDOWS, as_of=None):
+    """
+    Average units per day over each trailing window ending on as_of (inclusive).
+    Returns {sku: {window_days: units_per_day}}.
+    """
+    as_of = as_of or date.today()
+    starts = [(as_of - timedelta(days=w - 1)).isoformat() for w in windows]
+    sums = ", ".join("SUM(CASE WHEN day >= ? THEN qty ELSE 0 END)" for _ in windows)
+    cur = conn.execute(
+        f"SELECT sku, {sums} FROM daily_sku_demand "
+        "WHERE view = ? AND day BETWEEN ? AND ? GROUP BY sku",
+        (*starts, view, min(starts), as_of.isoformat())
+    )
+    return {
+        row[0]: {w: total / w for w, total in zip(windows, row[1:])}
+        for row in cur.fetchall()
+    }
+
+def days_of_cover(stock, velocity, window=COVER_WINDOW):
+    """Days the given stock lasts at the window's velocity, or None if there is no demand."""
+    rate = (velocity or {}).get(window, 0.0)
+    if rate <= 0:
+        return None
+    return max(stock, 0) / rate
+
+def load_velocity(view, db_path=DB_PATH):
+    """Read-only velocity lookup for the dashboard. Returns {} when no local history exists."""
+    if not os.path.exists(db_path):
+        return {}
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return get_velocity(conn, view)
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(DB_PATH)
+    rolled = rebuild_rollups(conn)
+    conn.close()
+    print(f"✅ Rebuilt demand rollups from {rolled} order lines")
@@ -1,28 +1,22 @@
-import os
-import requests
 import csv
-from dotenv import load_dotenv
 from collections import defaultdict
+import config
+import rate_governor
 
-load_dotenv()
-
-SHOP_URL = os.getenv("SHOPIFY_SHOP_URL")
-ACCESS_TOKEN = os.getenv("SHOPIFY_ACCESS_TOKEN")
-
-if not SHOP_URL or not ACCESS_TOKEN:
-    raise ValueError("Missing SHOPIFY_SHOP_URL or SHOPIFY_ACCESS_TOKEN in .env")
-
-HEADERS = {
-    "X-Shopify-Access-Token": ACCESS_TOKEN,
-    "Content-Type": "application/json"
-}
-
-def fetch_all_products():
-    endpoint = f"https://{SHOP_URL}/admin/api/2023-10/products.json?limit=250"
+def fetch_all_products(shop_url=None, access_token=None):
+    shop_url = shop_url or config.get("SHOPIFY_SHOP_URL")
+    headers = {
+        "X-Shopify-Access-Token": access_token or config.get("SHOPIFY_ACCESS_TOKEN"),
+        "Content-Type": "application/json"
+    }
+    # Only ask for the fields the audit reads; full product payloads are mostly HTML and images
+    endpoint = f"https://{shop_url}/admin/api/2023-10/products.json?limit=250&fields=id,title,status,variants"
     variants = []
+    # Shares the store's rate bucket with any sync running in the same process
+    bucket = rate_governor.get_bucket("shopify", shop_url, label=shop_url)
 
     while endpoint:
-        response = requests.get(endpoint, headers=HEADERS)
+        response = rate_governor.request(bucket, "GET", endpoint, headers=headers)
         response.raise_for_status()
         products = response.json().get("products", [])
         for product in products:
@@ -34,6 +28,7 @@ def fetch_all_products():
                     "variant_title": variant.get("title"),
                     "variant_id": variant.get("id"),
                     "product_id": product.get("id"),
+                    "inventory_item_id": variant.get("inventory_item_id"),
                     "archived": product.get("status", "") == "archived"
                 })
 
@@ -72,6 +67,8 @@ def export_duplicates_to_csv(duplicates, filename="duplicate_skus.csv"):
     print(f"📁 Saved duplicates to {filename}")
 
 if __name__ == "__main__":
+    config.require("SHOPIFY_SHOP_URL", "SHOPIFY_ACCESS_TOKEN")
+
     print("🔍 Fetching all product variants...")
     variants = fetch_all_products()
     print(f"✅ Retrieved {len(variants)} variants")
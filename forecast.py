@@ -0,0 +1,235 @@
+# -----------------------------
+# 📁 forecast.py (Vectorized demand forecasts, safety stock and reorder points)
+# -----------------------------
+import os
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+import numpy as np
+import config
+from order_store import DB_PATH
+from demand_rollup import init_rollups, refresh_rollups
+
+# Defaults for FORECAST_HISTORY_DAYS, REORDER_LEAD_TIME_DAYS, REORDER_SERVICE_Z and
+# FORECAST_SES_ALPHA; the overrides are read when a forecast runs, not at import
+HISTORY_DAYS = 182
+LEAD_TIME_DAYS = 14
+SERVICE_Z = 1.65
+SES_ALPHA = 0.3
+SEASON_DAYS = 7
+MAX_AGE_SECONDS = 6 * 60 * 60
+
+def history_days():
+    return int(config.get("FORECAST_HISTORY_DAYS", HISTORY_DAYS))
+
+def lead_time_days():
+    return float(config.get("REORDER_LEAD_TIME_DAYS", LEAD_TIME_DAYS))
+
+def service_z():
+    return float(config.get("REORDER_SERVICE_Z", SERVICE_Z))
+
+def ses_alpha():
+    return float(config.get("FORECAST_SES_ALPHA", SES_ALPHA))
+
+def init_forecasts(conn):
+    c = conn.cursor()
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS sku_forecasts (
+            sku TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            forecast_daily REAL NOT NULL,
+            sigma_daily REAL NOT NULL,
+            safety_stock REAL NOT NULL,
+            reorder_point REAL NOT NULL,
+            computed_at TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+
+def load_demand_matrix(conn, view, days=None, as_of=None):
+    """Returns (skus, Y) where Y[i, t] is demand for skus[i] on day t, oldest day first."""
+    days = days or history_days()
+    as_of = as_of or date.today()
+    start = as_of - timedelta(days=days - 1)
+    rows = conn.execute("""
+        SELECT sku, day, qty FROM daily_sku_demand
+        WHERE view = ? AND day BETWEEN ? AND ?
+    """, (view, start.isoformat(), as_of.isoformat())).fetchall()
+
+    skus = sorted({sku for sku, _, _ in rows})
+    sku_idx = {sku: i for i, sku in enumerate(skus)}
+    Y = np.zeros((len(skus), days))
+    if rows:
+        r = np.fromiter((sku_idx[sku] for sku, _, _ in rows), dtype=np.intp, count=len(rows))
+        t = np.fromiter(
+            ((date.fromisoformat(day) - start).days for _, day, _ in rows), dtype=np.intp, count=len(rows)
+        )
+        np.add.at(Y, (r, t), np.fromiter((qty for _, _, qty in rows), dtype=float, count=len(rows)))
+    return skus, Y
+
+def exponential_smoothing(Y, alpha=None):
+    """Simple exponential smoothing for every row at once. Returns (next-day level, one-step residuals)."""
+    alpha = ses_alpha() if alpha is None else alpha
+    n_skus, n_days = Y.shape
+    level = Y[:, 0].copy() if n_days else np.zeros(n_skus)
+    residuals = np.zeros((n_skus, max(n_days - 1, 0)))
+    for t in range(1, n_days):
+        residuals[:, t - 1] = Y[:, t] - level
+        level += alpha * residuals[:, t - 1]
+    return level, residuals
+
+def seasonal_naive(Y, season=SEASON_DAYS):
+    """Weekly seasonal naive for every row at once. Returns (mean daily forecast, residuals)."""
+    if Y.shape[1] <= season:
+        return Y.mean(axis=1) if Y.shape[1] else np.zeros(Y.shape[0]), np.zeros((Y.shape[0], 0))
+    return Y[:, -season:].mean(axis=1), Y[:, season:] - Y[:, :-season]
+
+def fit_models(Y):
+    """
+    Fits both models to every SKU and keeps whichever has the lower mean absolute error.
+    Returns (model names, daily forecast, residual std-dev), each one entry per row of Y.
+    """
+    ses_level, ses_resid = exponential_smoothing(Y)
+    sn_level, sn_resid = seasonal_naive(Y)
+
+    def mae(resid):
+        return np.abs(resid).mean(axis=1) if resid.shape[1] else np.full(resid.shape[0], np.inf)
+
+    def std(resid):
+        return resid.std(axis=1) if resid.shape[1] > 1 else np.zeros(resid.shape[0])
+
+    use_ses = mae(ses_resid) <= mae(sn_resid)
+    forecast = np.maximum(np.where(use_ses, ses_level, sn_level), 0.0)
+    sigma = np.where(use_ses, std(ses_resid), std(sn_resid))
+    models = np.where(use_ses, "ses", "seasonal_naive")
+    return models, forecast, sigma
+
+def bom_matrix(kits, inventory, kit_skus, comp_skus):
+    """B[k, c] = units of comp_skus[c] used by one virtual kit kit_skus[k]."""
+    comp_idx = {sku: i for i, sku in enumerate(comp_skus)}
+    B = np.zeros((len(kit_skus), len(comp_skus)))
+    for k, kit_sku in enumerate(kit_skus):
+        if kit_sku in inventory:
+            continue
+        for comp in kits.get(kit_sku, []):
+            c = comp_idx.get(comp["sku"].strip().upper())
+            if c is not None:
+                B[k, c] += float(comp["qty"])
+    return B
+
+def compute_forecasts(conn, kits, inventory, lead_time=None, z=None, as_of=None):
+    """
+    Forecasts ordered demand for every SKU and virtual kit, then pushes kit forecasts
+    through the BOM so component forecasts include the demand their kits generate.
+    Returns {sku: {"model", "forecast_daily", "sigma_daily", "safety_stock", "reorder_point"}}.
+    """
+    lead_time = lead_time_days() if lead_time is None else lead_time
+    z = service_z() if z is None else z
+    skus, Y = load_demand_matrix(conn, "ordered", as_of=as_of)
+    models, forecast, sigma = fit_models(Y)
+
+    virtual = np.array([sku in kits and sku not in inventory for sku in skus], dtype=bool)
+    kit_skus = [sku for sku, v in zip(skus, virtual) if v]
+    comp_skus = sorted(
+        {sku for sku, v in zip(skus, virtual) if not v}
+        | {comp["sku"].strip().upper() for kit in kit_skus for comp in kits[kit]}
+    )
+    comp_pos = {sku: i for i, sku in enumerate(comp_skus)}
+    comp_idx = np.array([comp_pos[sku] for sku, v in zip(skus, virtual) if not v], dtype=np.intp)
+
+    B = bom_matrix(kits, inventory, kit_skus, comp_skus)
+    comp_forecast = forecast[virtual] @ B
+    # Kits and standalone demand are treated as independent, so variances add
+    comp_var = (sigma[virtual] ** 2) @ (B ** 2)
+    comp_models = np.full(len(comp_skus), "bom", dtype=object)
+
+    np.add.at(comp_forecast, comp_idx, forecast[~virtual])
+    np.add.at(comp_var, comp_idx, sigma[~virtual] ** 2)
+    comp_models[comp_idx] = models[~virtual]
+
+    comp_sigma = np.sqrt(comp_var)
+    safety_stock = z * comp_sigma * np.sqrt(lead_time)
+    reorder_point = comp_forecast * lead_time + safety_stock
+
+    return {
+        sku: {
+            "model": str(comp_models[i]),
+            "forecast_daily": float(comp_forecast[i]),
+            "sigma_daily": float(comp_sigma[i]),
+            "safety_stock": float(safety_stock[i]),
+            "reorder_point": float(reorder_point[i])
+        }
+        for i, sku in enumerate(comp_skus)
+    }
+
+def save_forecasts(conn, forecasts):
+    init_forecasts(conn)
+    computed_at = datetime.now().isoformat()
+    with conn:
+        conn.execute("DELETE FROM sku_forecasts")
+        conn.executemany(
+            "INSERT INTO sku_forecasts VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (sku, f["model"], f["forecast_daily"], f["sigma_daily"],
+                 f["safety_stock"], f["reorder_point"], computed_at)
+                for sku, f in forecasts.items()
+            ]
+        )
+
+def run_forecast(conn, kits, inventory):
+    """Refreshes rollups, recomputes every forecast and caches them in sku_forecasts."""
+    refresh_rollups(conn)
+    forecasts = compute_forecasts(conn, kits, inventory)
+    save_forecasts(conn, forecasts)
+    return forecasts
+
+def forecasts_age(conn):
+    """Seconds since the cached forecasts were computed, or None if there are none."""
+    init_forecasts(conn)
+    row = conn.execute("SELECT MAX(computed_at) FROM sku_forecasts").fetchone()
+    if not row or not row[0]:
+        return None
+    return (datetime.now() - datetime.fromisoformat(row[0])).total_seconds()
+
+def load_forecasts(db_path=DB_PATH):
+    """Read-only lookup of cached forecasts for the dashboard. Returns {} when none exist."""
+    if not os.path.exists(db_path):
+        return {}
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cur = conn.execute(
+            "SELECT sku, model, forecast_daily, sigma_daily, safety_stock, reorder_point FROM sku_forecasts"
+        )
+        return {
+            sku: {
+                "model": model,
+                "forecast_daily": forecast_daily,
+                "sigma_daily": sigma_daily,
+                "safety_stock": safety_stock,
+                "reorder_point": reorder_point
+            }
+            for sku, model, forecast_daily, sigma_daily, safety_stock, reorder_point in cur.fetchall()
+        }
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+
+def suggested_reorder(stock, open_demand, forecast):
+    """Units needed to bring stock net of open orders back up to the reorder point."""
+    if not forecast:
+        return 0.0
+    return max(forecast["reorder_point"] - (stock - open_demand), 0.0)
+
+if __name__ == "__main__":
+    from sheet_loader import load_kits_from_sheets, load_inventory_from_sheets
+
+    conn = sqlite3.connect(DB_PATH)
+    init_rollups(conn)
+    age = forecasts_age(conn)
+    if age is not None and age < MAX_AGE_SECONDS and "--force" not in sys.argv:
+        print(f"⏩ Forecasts are {age / 60:.0f} min old, skipping (use --force to recompute)")
+    else:
+        forecasts = run_forecast(conn, load_kits_from_sheets(), load_inventory_from_sheets())
+        print(f"✅ Computed forecasts for {len(forecasts)} SKUs")
+    conn.close()
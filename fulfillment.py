@@ -0,0 +1,166 @@
+# -----------------------------
+# 📁 fulfillment.py (SKU Fulfillment Summary table, shared by app.py and the snapshot worker)
+# -----------------------------
+from collections import defaultdict
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from demand_rollup import VELOCITY_WINDOWS, COVER_WINDOW
+
+VIEW_MODES = ["Stock Components View", "Ordered SKUs View"]
+PAGE_SIZES = [50, 100, 250, 500]
+EXPORT_CHUNK_ROWS = 5000
+
+def rollup_view(view_mode):
+    """Maps a dashboard view mode to the matching demand_rollup view."""
+    return "ordered" if view_mode == "Ordered SKUs View" else "component"
+
+def get_kit_names(kits):
+    kit_names = {}
+    for kit_sku, components in kits.items():
+        for comp in components:
+            if "kit_name" in comp:
+                kit_names[kit_sku] = comp["kit_name"]
+                break
+        if kit_sku not in kit_names:
+            kit_names[kit_sku] = kit_sku
+    return kit_names
+
+# Demand calculation
+def get_sku_totals(orders, kits, inventory, separate_virtual=False):
+    exploded = defaultdict(lambda: {"total": 0.0, "from_kits": 0.0, "standalone": 0.0})
+    for order in orders:
+        for item in order.get("items", []):
+            sku = (item.get("sku") or '').strip().upper()
+            qty = item.get("quantity", 0)
+            if sku in kits:
+                if separate_virtual:
+                    exploded[sku]["total"] += qty
+                    exploded[sku]["standalone"] += qty
+                else:
+                    for comp in kits[sku]:
+                        comp_sku = comp["sku"].strip().upper()
+                        exploded[comp_sku]["total"] += qty * float(comp["qty"])
+                        exploded[comp_sku]["from_kits"] += qty * float(comp["qty"])
+                if sku in inventory:
+                    exploded[sku]["total"] += qty
+                    exploded[sku]["standalone"] += qty
+            else:
+                exploded[sku]["total"] += qty
+                exploded[sku]["standalone"] += qty
+    return exploded
+
+def build_fulfillment_table(demand, kits, inventory, all_skus, view_mode, velocity, forecasts):
+    """
+    Builds the SKU Fulfillment Summary as a pyarrow Table, one column at a time.
+
+    demand is (sku -> row position, matrix of [total, from_kits, standalone] rows),
+    as returned by OrderIndex.demand. Rows come back sorted by Total Quantity Needed.
+    """
+    sku_idx, matrix = demand
+    kit_names = get_kit_names(kits)
+    display_skus = list(inventory.keys()) if view_mode == "Stock Components View" else sorted(all_skus)
+    n = len(display_skus)
+
+    rows = np.fromiter((sku_idx.get(sku, -1) for sku in display_skus), dtype=np.intp, count=n)
+    present = rows >= 0
+    totals = np.zeros((n, 3))
+    totals[present] = matrix[rows[present]]
+    total, from_kits, standalone = totals.T
+
+    stock = np.fromiter((inventory.get(sku, {}).get("stock", 0.0) for sku in display_skus), dtype=float, count=n)
+    names = [
+        (inventory[sku].get("name") or kit_names.get(sku, sku)) if sku in inventory else sku
+        for sku in display_skus
+    ]
+
+    velocities = {
+        window: np.fromiter(
+            (velocity.get(sku, {}).get(window, 0.0) for sku in display_skus), dtype=float, count=n
+        )
+        for window in VELOCITY_WINDOWS
+    }
+    cover_rate = velocities.get(COVER_WINDOW, np.zeros(n))
+    has_cover = cover_rate > 0
+    cover = np.divide(np.maximum(stock, 0), cover_rate, out=np.zeros(n), where=has_cover)
+
+    has_forecast = np.fromiter((sku in forecasts for sku in display_skus), dtype=bool, count=n)
+    reorder_point = np.fromiter(
+        (forecasts[sku]["reorder_point"] if sku in forecasts else 0.0 for sku in display_skus), dtype=float, count=n
+    )
+    suggested = np.where(has_forecast, np.maximum(reorder_point - (stock - total), 0.0), 0.0)
+
+    columns = {
+        "Is Kit": pa.array(["✅" if sku in kits else "" for sku in display_skus], type=pa.string()),
+        "SKU": pa.array(display_skus, type=pa.string()),
+        "Product Name": pa.array(names, type=pa.string()),
+        "Total Quantity Needed": np.round(total, 2),
+        "From Kits": np.round(from_kits, 2),
+        "Standalone Orders": np.round(standalone, 2),
+        "Stock On Hand": np.round(stock, 2),
+        "Qty Short": np.round(np.maximum(total - stock, 0), 2),
+        "Reorder Point": pa.array(np.round(reorder_point, 2), mask=~has_forecast),
+        "Suggested Reorder": np.round(suggested, 2),
+        "Running Inventory": np.round(np.maximum(stock - total, 0), 2)
+    }
+    for window in VELOCITY_WINDOWS:
+        columns[f"Velocity {window}d"] = np.round(velocities[window], 2)
+    columns["Days of Cover"] = pa.array(np.round(cover, 1), mask=~has_cover)
+
+    order = np.argsort(-columns["Total Quantity Needed"], kind="stable")
+    return pa.table(columns).take(order)
+
+def search_table(table, search="", only_short=False):
+    """Server-side search (SKU or product name, case-insensitive) and shortage filter."""
+    mask = None
+    if search:
+        pattern = search.strip()
+        mask = pc.or_(
+            pc.match_substring(table["SKU"], pattern, ignore_case=True),
+            pc.match_substring(table["Product Name"], pattern, ignore_case=True)
+        )
+    if only_short:
+        short = pc.greater(table["Qty Short"], 0)
+        mask = short if mask is None else pc.and_(mask, short)
+    return table if mask is None else table.filter(mask)
+
+def get_export_formats():
+    """{label: (extension, mime type)}; XLSX is offered only when openpyxl is installed."""
+    formats = {
+        "CSV": ("csv", "text/csv"),
+        "Parquet": ("parquet", "application/vnd.apache.parquet")
+    }
+    try:
+        import openpyxl  # noqa: F401
+        formats["XLSX"] = ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    except ImportError:
+        pass
+    return formats
+
+def export_table(table, fmt, sink, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Writes the table into a binary file-like sink chunk_rows at a time, so the
+    writer never converts more than one chunk at once. An in-memory sink still
+    ends up holding the whole file.
+    """
+    if fmt == "CSV":
+        with pacsv.CSVWriter(sink, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=chunk_rows):
+                writer.write_batch(batch)
+    elif fmt == "Parquet":
+        with pq.ParquetWriter(sink, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=chunk_rows):
+                writer.write_batch(batch)
+    elif fmt == "XLSX":
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("SKU Fulfillment Summary")
+        sheet.append(table.column_names)
+        for batch in table.to_batches(max_chunksize=chunk_rows):
+            for row in zip(*(column.to_pylist() for column in batch.columns)):
+                sheet.append(row)
+        workbook.save(sink)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
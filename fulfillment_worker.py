@@ -0,0 +1,165 @@
+# -----------------------------
+# 📁 fulfillment_worker.py (Background worker keeping fulfillment tables as Arrow snapshots)
+# -----------------------------
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+import pyarrow as pa
+import data_cache
+from demand_rollup import load_velocity
+from forecast import load_forecasts
+from fulfillment import (
+    VIEW_MODES,
+    rollup_view,
+    build_fulfillment_table
+)
+
+SNAPSHOT_DIR = "snapshots"
+# Trailing windows (days back from today) the dashboard is most often opened with
+SNAPSHOT_WINDOWS = (7, 14, 30)
+SNAPSHOT_FORMAT = "1"
+REFRESH_SECONDS = 30
+# Velocity and forecasts live in order_log.db, outside data_cache's versioning
+MAX_SNAPSHOT_AGE = 5 * 60
+# Stop touching the caches (and so the APIs behind them) once no session has rerun for this long;
+# open dashboards autorefresh every 5 minutes, so this only trips when nobody is connected
+IDLE_AFTER_SECONDS = 10 * 60
+
+_worker = None
+_worker_lock = threading.Lock()
+_wake = threading.Event()
+_last_built = {"version": None, "day": None, "at": 0.0}
+_last_active = {"at": 0.0}
+
+def mark_active():
+    """Records that a session just used the snapshots, waking the worker if it had gone idle."""
+    was_idle = time.time() - _last_active["at"] > IDLE_AFTER_SECONDS
+    _last_active["at"] = time.time()
+    if was_idle:
+        _wake.set()
+
+def snapshot_path(view_mode, window_days):
+    return os.path.join(SNAPSHOT_DIR, f"fulfillment_{rollup_view(view_mode)}_{window_days}d.arrow")
+
+def write_snapshot(table, path, metadata):
+    """Writes the table as an uncompressed Arrow IPC file, which readers load without decoding."""
+    table = table.replace_schema_metadata({k: str(v) for k, v in metadata.items()})
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+def build_snapshots():
+    """Builds every view mode x window snapshot from the shared caches. Returns the data version used."""
+    # Retry if a reload lands while we read, so the stamp always matches the data
+    for _ in range(3):
+        version = data_cache.data_version()
+        kits = data_cache.get_kits()
+        inventory = data_cache.get_inventory()
+        all_skus = data_cache.get_all_skus()
+        index = data_cache.get_order_index()
+        if data_cache.data_version() == version:
+            break
+    else:
+        return None
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    forecasts = load_forecasts()
+    today = date.today()
+    generated_at = datetime.now().isoformat()
+
+    for view_mode in VIEW_MODES:
+        velocity = load_velocity(rollup_view(view_mode))
+        for window in SNAPSHOT_WINDOWS:
+            start = today - timedelta(days=window)
+            demand = index.demand(start, today, separate_virtual=(view_mode == "Ordered SKUs View"))
+            table = build_fulfillment_table(demand, kits, inventory, all_skus, view_mode, velocity, forecasts)
+            try:
+                write_snapshot(table, snapshot_path(view_mode, window), {
+                    "format": SNAPSHOT_FORMAT,
+                    "version": version,
+                    "generated_at": generated_at,
+                    "view_mode": view_mode,
+                    "start_date": start.isoformat(),
+                    "end_date": today.isoformat(),
+                    "order_count": index.order_count(start, today)
+                })
+            except OSError as e:
+                # Windows won't replace a file while a reader has it open; the next cycle retries
+                logging.warning(f"[WARN] Could not write fulfillment snapshot: {e}")
+    return version
+
+def load_snapshot(view_mode, start_date, end_date):
+    """
+    Reads the snapshot for this view and date range if one exists and was
+    built from the current cached data. Returns (pyarrow.Table, metadata) or None.
+    """
+    mark_active()
+    window = (end_date - start_date).days
+    if end_date != date.today() or window not in SNAPSHOT_WINDOWS:
+        return None
+    path = snapshot_path(view_mode, window)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        # Read into memory and close the file before returning: a mapping kept alive by the
+        # table would stop write_snapshot() from replacing the file on Windows
+        with pa.OSFile(path, "rb") as source:
+            reader = pa.ipc.open_file(source)
+            metadata = {k.decode(): v.decode() for k, v in (reader.schema.metadata or {}).items()}
+            if (
+                metadata.get("format") != SNAPSHOT_FORMAT
+                or metadata.get("version") != data_cache.data_version()
+                or metadata.get("end_date") != end_date.isoformat()
+            ):
+                return None
+            return reader.read_all(), metadata
+    except (OSError, pa.ArrowInvalid) as e:
+        logging.warning(f"[WARN] Could not read fulfillment snapshot {path}: {e}")
+        return None
+
+def _run():
+    while True:
+        if time.time() - _last_active["at"] > IDLE_AFTER_SECONDS:
+            # Nobody is looking: sleep until a session reruns instead of reloading caches on a timer
+            _wake.wait()
+            _wake.clear()
+            continue
+        try:
+            # Touch the caches so expired datasets reload (and bump the version) on our thread
+            data_cache.get_kits()
+            data_cache.get_inventory()
+            data_cache.get_order_index()
+            version = data_cache.data_version()
+            stale = (
+                version != _last_built["version"]
+                or date.today() != _last_built["day"]
+                or time.time() - _last_built["at"] > MAX_SNAPSHOT_AGE
+            )
+            if stale:
+                started = time.time()
+                built = build_snapshots()
+                if built is not None:
+                    _last_built.update(version=built, day=date.today(), at=time.time())
+                    logging.info(f"[SNAPSHOT] Fulfillment snapshots {built} built in {time.time() - started:.2f}s")
+        except Exception as e:
+            logging.error(f"[ERROR] Fulfillment snapshot build failed: {e}")
+        _wake.wait(REFRESH_SECONDS)
+        _wake.clear()
+
+def ensure_started():
+    """Starts the worker thread once per process; every session shares it."""
+    global _worker
+    mark_active()
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="fulfillment-snapshots", daemon=True)
+            _worker.start()
+
+def request_refresh():
+    """Wakes the worker early, e.g. after an inventory write or a snapshot miss."""
+    _wake.set()
@@ -0,0 +1,314 @@
+# -----------------------------
+# 📁 inventory_ledger.py (Append-only inventory events with coalesced sheet write-back)
+# -----------------------------
+import logging
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+from order_store import DB_PATH
+from rate_governor import sheets_call
+
+# receive/adjust/ship are deltas (ship never takes stock below 0, like the old
+# deduction); set is an absolute count; observe records what the sheet held after a flush.
+DELTA_KINDS = ("receive", "adjust", "ship")
+ABSOLUTE_KINDS = ("set", "observe")
+FLUSH_DELAY_SECONDS = 5
+# A claim older than this belongs to a flusher that died mid-write; its events are picked up again
+CLAIM_TIMEOUT_SECONDS = 10 * 60
+
+_flush_timer = None
+_flush_timer_lock = threading.Lock()
+_initialized = set()
+
+def connect(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path, timeout=30)
+    if db_path not in _initialized:
+        init_ledger(conn)
+        _initialized.add(db_path)
+    return conn
+
+def init_ledger(conn):
+    c = conn.cursor()
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS inventory_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recorded_at TEXT NOT NULL,
+            sku TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            qty REAL NOT NULL,
+            source TEXT,
+            synced_at TEXT,
+            claim TEXT,
+            claimed_at TEXT,
+            through_id INTEGER,
+            synced_mark INTEGER
+        )
+    """)
+    # through_id: on observe rows, the highest event id folded into the observed stock.
+    # synced_mark: the ledger's last event id when the flush that wrote this event committed.
+    columns = {row[1] for row in c.execute("PRAGMA table_info(inventory_events)")}
+    for column, kind in (("claim", "TEXT"), ("claimed_at", "TEXT"), ("through_id", "INTEGER"),
+                         ("synced_mark", "INTEGER")):
+        if column not in columns:
+            c.execute(f"ALTER TABLE inventory_events ADD COLUMN {column} {kind}")
+            if column == "synced_mark":
+                # Events flushed before the column existed are already in any sheet read from now on
+                c.execute("UPDATE inventory_events SET synced_mark = id WHERE synced_at IS NOT NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inventory_events_sku_time ON inventory_events (sku, recorded_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inventory_events_pending ON inventory_events (id) WHERE synced_at IS NULL")
+    c.execute("DROP INDEX IF EXISTS idx_inventory_events_synced_at")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inventory_events_synced_mark ON inventory_events (synced_mark)")
+    conn.commit()
+
+def apply_event(stock, kind, qty):
+    if kind in ABSOLUTE_KINDS:
+        return qty
+    if kind == "ship":
+        return max(stock - qty, 0.0)
+    return stock + qty
+
+def fold(stock, events):
+    """Applies (kind, qty) events in order to a starting stock level."""
+    for kind, qty in events:
+        stock = apply_event(stock, kind, qty)
+    return stock
+
+def record_event(sku, kind, qty, source=None, db_path=DB_PATH):
+    """Appends one event and returns its id. Nothing touches the sheet until the next flush."""
+    return record_events([(sku, kind, qty)], source, db_path)[0]
+
+def record_events(events, source=None, db_path=DB_PATH):
+    """Appends [(sku, kind, qty), ...] in one transaction. Returns their ids."""
+    conn = connect(db_path)
+    try:
+        with conn:
+            return insert_events(conn, events, source)
+    finally:
+        conn.close()
+
+def insert_events(conn, events, source=None):
+    """Inserts events on the caller's connection without committing, so they share its transaction."""
+    recorded_at = datetime.now().isoformat()
+    ids = []
+    for sku, kind, qty in events:
+        if kind not in DELTA_KINDS + ABSOLUTE_KINDS:
+            raise ValueError(f"Unknown inventory event kind: {kind}")
+        cur = conn.execute(
+            "INSERT INTO inventory_events (recorded_at, sku, kind, qty, source) VALUES (?, ?, ?, ?, ?)",
+            (recorded_at, sku.strip().upper(), kind, float(qty), source)
+        )
+        ids.append(cur.lastrowid)
+    return ids
+
+def last_event_id(db_path=DB_PATH):
+    """The newest event id. Taken right after a sheet read, it is the `mark` overlay() expects."""
+    conn = connect(db_path)
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM inventory_events").fetchone()[0]
+    finally:
+        conn.close()
+
+def has_pending(db_path=DB_PATH):
+    """
+    Whether any event is waiting for a flush (pending and not claimed by a live one).
+    Cheap enough to check before opening the sheet.
+    """
+    stale = (datetime.now() - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)).isoformat()
+    conn = connect(db_path)
+    try:
+        return bool(conn.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM inventory_events
+                WHERE synced_at IS NULL AND (claim IS NULL OR claimed_at < ?)
+            )
+        """, (stale,)).fetchone()[0])
+    finally:
+        conn.close()
+
+def unsynced_events(mark=None, db_path=DB_PATH):
+    """
+    {sku: [(kind, qty), ...]} for events not yet in a sheet read that ended at ledger
+    position `mark`: still pending, or flushed by a flush that committed after it.
+    Without a mark only pending events are returned.
+    """
+    conn = connect(db_path)
+    try:
+        # No ORDER BY: sorting in SQL makes SQLite walk the whole table in id order instead
+        # of taking the two synced_mark index ranges (NULL and > mark); the handful of matches is sorted here
+        if mark is None:
+            where, params = "synced_at IS NULL", ()
+        else:
+            where, params = "(synced_mark IS NULL OR synced_mark > ?)", (mark,)
+        rows = conn.execute(
+            f"SELECT id, sku, kind, qty FROM inventory_events WHERE kind != 'observe' AND {where}", params
+        ).fetchall()
+        pending = {}
+        for _, sku, kind, qty in sorted(rows):
+            pending.setdefault(sku, []).append((kind, qty))
+        return pending
+    finally:
+        conn.close()
+
+def overlay(inventory, mark=None, db_path=DB_PATH):
+    """
+    Returns the inventory with unsynced events applied, so adjustments show up
+    before they reach the sheet. `mark` is last_event_id() taken right after the
+    inventory was read from the sheet. Returns the same dict when there is nothing to apply.
+    """
+    pending = unsynced_events(mark, db_path)
+    pending = {sku: events for sku, events in pending.items() if sku in inventory}
+    if not pending:
+        return inventory
+    patched = dict(inventory)
+    for sku, events in pending.items():
+        patched[sku] = {**inventory[sku], "stock": fold(inventory[sku]["stock"], events)}
+    return patched
+
+def _claim_pending(conn, token):
+    """
+    Stamps pending events with this flush's claim token in one short write
+    transaction and returns them. SKUs another live flush has claimed are skipped
+    until it finishes, so two flushers never read-modify-write the same cell.
+    """
+    now = datetime.now()
+    stale = (now - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)).isoformat()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("""
+            SELECT id, sku, kind, qty FROM inventory_events
+            WHERE synced_at IS NULL AND sku NOT IN (
+                SELECT sku FROM inventory_events
+                WHERE synced_at IS NULL AND claim IS NOT NULL AND claimed_at >= ?
+            )
+            ORDER BY id
+        """, (stale,)).fetchall()
+        conn.executemany(
+            "UPDATE inventory_events SET claim = ?, claimed_at = ? WHERE id = ?",
+            [(token, now.isoformat(), row[0]) for row in rows]
+        )
+    return rows
+
+def _release_claim(conn, token):
+    with conn:
+        conn.execute("UPDATE inventory_events SET claim = NULL, claimed_at = NULL WHERE claim = ?", (token,))
+
+def flush(sheet, db_path=DB_PATH):
+    """
+    Writes every pending event back to the inventory sheet in one batch.
+
+    Pending events are claimed in a short transaction, the sheet is read and
+    written with no database lock held, and the claimed events are marked synced
+    in a second short transaction (or released if the write fails). Current sheet
+    values (including manual edits) are read once and pending events for each SKU
+    are folded on top of them. Returns {sku: new_stock} for what was written.
+    """
+    token = uuid.uuid4().hex
+    conn = connect(db_path)
+    conn.isolation_level = None
+    try:
+        rows = _claim_pending(conn, token)
+        if not rows:
+            return {}
+
+        try:
+            data = sheets_call(sheet.get_all_records)
+            sku_to_row = {row["SKU"].strip().upper(): idx for idx, row in enumerate(data)}
+
+            pending = {}
+            for _, sku, kind, qty in rows:
+                pending.setdefault(sku, []).append((kind, qty))
+
+            batch_updates = []
+            new_stocks = {}
+            for sku, events in pending.items():
+                idx = sku_to_row.get(sku)
+                if idx is None:
+                    logging.warning(f"[WARN] SKU {sku} not found in inventory sheet; dropping {len(events)} event(s)")
+                    continue
+                try:
+                    old_stock = float(data[idx].get("Stock On Hand", 0))
+                except (TypeError, ValueError):
+                    old_stock = 0.0
+                new_stock = fold(old_stock, events)
+                new_stocks[sku] = new_stock
+                batch_updates.append({"range": f"C{idx + 2}", "values": [[new_stock]]})
+                logging.info(f"[STOCK] {sku}: {old_stock} → {new_stock} ({len(events)} event(s))")
+
+            if batch_updates:
+                sheets_call(sheet.batch_update, batch_updates)
+        except Exception:
+            _release_claim(conn, token)
+            raise
+
+        # Events recorded during the sheet round-trip get ids below the observe rows but
+        # aren't in them; through_id tells stock_at() where the observed stock ends
+        through_id = max(row[0] for row in rows)
+        synced_at = datetime.now().isoformat()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO inventory_events (recorded_at, sku, kind, qty, source, claim, through_id) "
+                "VALUES (?, ?, 'observe', ?, 'flush', ?, ?)",
+                [(synced_at, sku, stock, token, through_id) for sku, stock in new_stocks.items()]
+            )
+            # The mark is at least every id this flush wrote, so a sheet read whose mark is
+            # below it still gets these events overlaid and one at or above it doesn't
+            synced_mark = conn.execute("SELECT MAX(id) FROM inventory_events").fetchone()[0]
+            conn.execute(
+                "UPDATE inventory_events SET synced_at = ?, synced_mark = ?, claim = NULL, claimed_at = NULL "
+                "WHERE claim = ?",
+                (synced_at, synced_mark, token)
+            )
+        logging.info(f"[BATCH] Flushed {len(rows)} event(s) to {len(batch_updates)} SKU(s)")
+        return new_stocks
+    finally:
+        conn.close()
+
+def stock_at(sku, at, db_path=DB_PATH):
+    """
+    Stock for one SKU as of the datetime `at`: the last absolute event (set or
+    flush observation) at or before `at` plus the events it doesn't include.
+    Returns None when the ledger has no absolute starting point yet.
+    """
+    sku = sku.strip().upper()
+    at = at.isoformat() if isinstance(at, datetime) else str(at)
+    conn = connect(db_path)
+    try:
+        base = conn.execute("""
+            SELECT qty, COALESCE(through_id, id) FROM inventory_events
+            WHERE sku = ? AND recorded_at <= ? AND kind IN ('set', 'observe')
+            ORDER BY recorded_at DESC, id DESC LIMIT 1
+        """, (sku, at)).fetchone()
+        if base is None:
+            return None
+        events = conn.execute("""
+            SELECT kind, qty FROM inventory_events
+            WHERE sku = ? AND recorded_at <= ? AND id > ? AND kind != 'observe'
+            ORDER BY id
+        """, (sku, at, base[1])).fetchall()
+        return fold(base[0], events)
+    finally:
+        conn.close()
+
+def schedule_flush(get_sheet, delay=FLUSH_DELAY_SECONDS):
+    """
+    Flushes after `delay` seconds on a background thread. Calls made while a flush
+    is already scheduled are coalesced into it.
+    """
+    global _flush_timer
+
+    def run():
+        global _flush_timer
+        with _flush_timer_lock:
+            _flush_timer = None
+        try:
+            flush(get_sheet())
+        except Exception as e:
+            logging.error(f"[ERROR] Inventory ledger flush failed: {e}")
+
+    with _flush_timer_lock:
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(delay, run)
+            _flush_timer.daemon = True
+            _flush_timer.start()
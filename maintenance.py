@@ -0,0 +1,192 @@
+# -----------------------------
+# 📁 maintenance.py (Retention, vacuum and log rotation for order_log.db and logs/)
+# -----------------------------
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta
+import config
+from order_store import DB_PATH
+
+LOG_DIR = "logs"
+DAYS_TO_KEEP = 60
+# Defaults for ORDER_LINES_DAYS_TO_KEEP, LEDGER_DAYS_TO_KEEP and LOG_MAX_BYTES, read when maintenance runs
+ORDER_LINES_DAYS_TO_KEEP = 730
+LEDGER_DAYS_TO_KEEP = 365
+DELETE_CHUNK_ROWS = 5000
+CHUNK_PAUSE_SECONDS = 0.05
+VACUUM_PAGES = 2000
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_COMPRESS_AFTER_DAYS = 1
+
+def order_lines_days_setting():
+    return int(config.get("ORDER_LINES_DAYS_TO_KEEP", ORDER_LINES_DAYS_TO_KEEP))
+
+def ledger_days_setting():
+    return int(config.get("LEDGER_DAYS_TO_KEEP", LEDGER_DAYS_TO_KEEP))
+
+def log_max_bytes_setting():
+    return int(config.get("LOG_MAX_BYTES", LOG_MAX_BYTES))
+
+def connect(db_path=DB_PATH):
+    # A generous busy timeout lets maintenance wait out a sync's short write instead of failing
+    return sqlite3.connect(db_path, timeout=30)
+
+def ensure_indexes(conn):
+    c = conn.cursor()
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS processed_orders (
+            order_id TEXT PRIMARY KEY,
+            processed_at TEXT,
+            sku_summary TEXT
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_processed_orders_processed_at ON processed_orders (processed_at)")
+    conn.commit()
+
+def ensure_incremental_vacuum(conn):
+    """
+    Switches the DB to auto_vacuum=INCREMENTAL and WAL journaling. Changing
+    auto_vacuum on an existing file needs one full VACUUM, which only happens once.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        logging.info("🧰 Enabling incremental vacuum (one-time full VACUUM)...")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    conn.execute("PRAGMA journal_mode = WAL")
+
+def delete_in_chunks(conn, table, where, params, chunk_rows=DELETE_CHUNK_ROWS, key="rowid"):
+    """
+    Deletes matching rows a chunk at a time, committing between chunks so no
+    single transaction holds the write lock for long. WITHOUT ROWID tables pass
+    their primary key columns as `key`, e.g. "(view, sku, day)". Returns rows deleted.
+    """
+    total = 0
+    select_key = key.strip("()")
+    while True:
+        cur = conn.execute(
+            f"DELETE FROM {table} WHERE {key} IN (SELECT {select_key} FROM {table} WHERE {where} LIMIT ?)",
+            (*params, chunk_rows)
+        )
+        conn.commit()
+        total += cur.rowcount
+        if cur.rowcount < chunk_rows:
+            return total
+        time.sleep(CHUNK_PAUSE_SECONDS)
+
+def incremental_vacuum(conn, pages=VACUUM_PAGES):
+    """Returns up to `pages` free pages to the OS. Returns the number of free pages left."""
+    # executescript steps the pragma to completion; execute() would free a single page
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+def purge_old_ledger_events(conn, days_to_keep=None):
+    """
+    Deletes synced inventory_events older than the cutoff, except each SKU's
+    latest set/observe row before it and every event that row doesn't include,
+    so stock_at() still has a starting point for any time inside the retention window.
+    """
+    days_to_keep = days_to_keep or ledger_days_setting()
+    cutoff = (datetime.now() - timedelta(days=days_to_keep)).isoformat()
+    return delete_in_chunks(conn, "inventory_events", """
+        synced_at IS NOT NULL AND recorded_at < ? AND id < (
+            SELECT COALESCE(base.through_id + 1, base.id) FROM inventory_events base
+            WHERE base.sku = inventory_events.sku
+              AND base.kind IN ('set', 'observe')
+              AND base.recorded_at < ?
+            ORDER BY base.id DESC LIMIT 1
+        )
+    """, (cutoff, cutoff))
+
+def purge_old_orders(db_path=DB_PATH, days_to_keep=DAYS_TO_KEEP, lines_days_to_keep=None, ledger_days_to_keep=None):
+    lines_days_to_keep = lines_days_to_keep or order_lines_days_setting()
+    ledger_days_to_keep = ledger_days_to_keep or ledger_days_setting()
+    conn = connect(db_path)
+    try:
+        ensure_indexes(conn)
+        ensure_incremental_vacuum(conn)
+
+        cutoff = (datetime.now() - timedelta(days=days_to_keep)).isoformat()
+        deleted = delete_in_chunks(conn, "processed_orders", "processed_at < ?", (cutoff,))
+        if deleted:
+            logging.info(f"✅ Deleted {deleted} processed orders older than {days_to_keep} days.")
+        else:
+            logging.info("📭 No old rows to delete.")
+
+        has_lines = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'order_lines'"
+        ).fetchone()
+        if has_lines:
+            lines_cutoff = (datetime.now() - timedelta(days=lines_days_to_keep)).date().isoformat()
+            deleted_lines = delete_in_chunks(conn, "order_lines", "ship_date < ?", (lines_cutoff,))
+            if deleted_lines:
+                logging.info(f"✅ Deleted {deleted_lines} order lines older than {lines_days_to_keep} days.")
+
+        has_rollups = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_sku_demand'"
+        ).fetchone()
+        if has_rollups:
+            # Rollups cover the same history as order_lines, so a rebuild gives the same table
+            rollup_cutoff = (datetime.now() - timedelta(days=lines_days_to_keep)).date().isoformat()
+            deleted_days = delete_in_chunks(
+                conn, "daily_sku_demand", "day < ?", (rollup_cutoff,), key="(view, sku, day)"
+            )
+            if deleted_days:
+                logging.info(f"✅ Deleted {deleted_days} daily demand rollups older than {lines_days_to_keep} days.")
+
+        has_ledger = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'inventory_events'"
+        ).fetchone()
+        if has_ledger:
+            deleted_events = purge_old_ledger_events(conn, ledger_days_to_keep)
+            if deleted_events:
+                logging.info(f"✅ Deleted {deleted_events} inventory ledger events older than {ledger_days_to_keep} days.")
+
+        free_pages = incremental_vacuum(conn)
+        logging.info(f"🧰 Incremental vacuum done ({free_pages} free page(s) left)")
+    finally:
+        conn.close()
+
+def _compress(src, dest):
+    with open(src, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+def rotate_logs(log_dir=LOG_DIR, days_to_keep=DAYS_TO_KEEP, max_bytes=None):
+    """
+    Deletes .log/.gz files older than days_to_keep, gzips logs idle for a day,
+    and copy-truncates any log over max_bytes so writers with it open keep appending.
+    """
+    max_bytes = max_bytes or log_max_bytes_setting()
+    now = datetime.now()
+    for fname in os.listdir(log_dir):
+        if not fname.endswith((".log", ".gz")):
+            continue
+        fpath = os.path.join(log_dir, fname)
+        try:
+            stat = os.stat(fpath)
+            mtime = datetime.fromtimestamp(stat.st_mtime)
+            if now - mtime > timedelta(days=days_to_keep):
+                os.remove(fpath)
+                logging.info(f"🗑️ Deleted log file: {fname}")
+                continue
+            if fname.endswith(".gz"):
+                continue
+
+            stem = fname[:-len(".log")]
+            if stat.st_size > max_bytes:
+                dest = os.path.join(log_dir, f"{stem}_{now:%Y%m%d-%H%M%S}.log.gz")
+                _compress(fpath, dest)
+                with open(fpath, "r+b") as f:
+                    f.truncate(0)
+                logging.info(f"🗜️ Rotated {fname} ({stat.st_size // 1024} KB) → {os.path.basename(dest)}")
+            elif now - mtime > timedelta(days=LOG_COMPRESS_AFTER_DAYS):
+                dest = os.path.join(log_dir, f"{stem}_{mtime:%Y%m%d-%H%M%S}.log.gz")
+                _compress(fpath, dest)
+                os.remove(fpath)
+                logging.info(f"🗜️ Compressed {fname} → {os.path.basename(dest)}")
+        except OSError as e:
+            # Windows refuses to remove files another process still has open
+            logging.warning(f"[WARN] Could not maintain log file {fname}: {e}")
@@ -0,0 +1,176 @@
+# -----------------------------
+# 📁 orchestrator.py (Long-running in-process scheduler for all sync jobs)
+# -----------------------------
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import config
+import shipstation_sync
+import shopify_sync
+import forecast
+import inventory_ledger
+import profiling
+from run_sync_and_cleanup import cleanup_old_orders, cleanup_old_logs
+from order_store import DB_PATH
+from sheet_loader import get_gspread_client, load_kits_from_sheets, load_inventory_from_sheets, load_inflation_rules, get_inventory_sheet
+
+LOG_DIR = "logs"
+SHIPSTATION_INTERVAL = int(config.get("SHIPSTATION_INTERVAL_MIN", "15")) * 60
+SHOPIFY_INTERVAL = int(config.get("SHOPIFY_INTERVAL_MIN", "30")) * 60
+CLEANUP_INTERVAL = int(config.get("CLEANUP_INTERVAL_MIN", "1440")) * 60
+FORECAST_INTERVAL = int(config.get("FORECAST_INTERVAL_MIN", "360")) * 60
+LEDGER_FLUSH_INTERVAL = int(config.get("LEDGER_FLUSH_INTERVAL_MIN", "1")) * 60
+# Kits, inflation rules and store catalogs change rarely; reload them at most this often
+REFERENCE_TTL = int(config.get("REFERENCE_TTL_MIN", "60")) * 60
+TICK_SECONDS = 5
+
+def setup_logging():
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_filename = datetime.now().strftime("orchestrator_%Y-%m-%d_%H-%M-%S.log")
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(message)s",
+        handlers=[
+            logging.FileHandler(os.path.join(LOG_DIR, log_filename), encoding="utf-8"),
+            logging.StreamHandler(sys.stdout)
+        ],
+        force=True
+    )
+
+# Warm state shared by every job: one gspread client, the BOM and inflation
+# rules, per-store catalogs and the latest post-deduction inventory snapshot.
+state = {
+    "client": None,
+    "kits": None,
+    "kits_at": 0.0,
+    "inflated_skus_store2": None,
+    "inflation_at": 0.0,
+    "stores": [],
+    "sku_maps": {},
+    "sku_maps_at": {},
+    "snapshot": None
+}
+
+def get_client():
+    if state["client"] is None:
+        state["client"] = get_gspread_client()
+    return state["client"]
+
+def get_kits():
+    if state["kits"] is None or time.time() - state["kits_at"] > REFERENCE_TTL:
+        state["kits"] = load_kits_from_sheets(get_client())
+        state["kits_at"] = time.time()
+    return state["kits"]
+
+def get_inflation_rules():
+    if state["inflated_skus_store2"] is None or time.time() - state["inflation_at"] > REFERENCE_TTL:
+        state["inflated_skus_store2"] = load_inflation_rules(get_client())
+        state["inflation_at"] = time.time()
+    return state["inflated_skus_store2"]
+
+def get_sku_map(store):
+    name = store["name"]
+    now = time.time()
+    if name not in state["sku_maps"] or now - state["sku_maps_at"].get(name, 0) > REFERENCE_TTL:
+        logging.info(f"[CATALOG] Crawling {name} catalog")
+        state["sku_maps"][name] = shopify_sync.get_inventory_items(store)
+        state["sku_maps_at"][name] = now
+    return state["sku_maps"][name]
+
+# --- Jobs ---
+def shipstation_job():
+    state["snapshot"] = shipstation_sync.run_sync(client=get_client(), kits=get_kits())
+    # Push the fresh stock to Shopify next, ahead of any other due job, instead of waiting for its interval
+    if "shopify" in JOBS:
+        JOBS["shopify"]["next_run"] = 0.0
+
+def shopify_job():
+    snapshot = state["snapshot"]
+    state["snapshot"] = None
+    shopify_sync.run_sync(
+        stores=state["stores"],
+        inv_data=snapshot["inventory"] if snapshot else None,
+        kits=snapshot["kits"] if snapshot else get_kits(),
+        inflated_skus_store2=get_inflation_rules(),
+        get_sku_map=get_sku_map,
+        client=get_client()
+    )
+
+def ledger_job():
+    # Opening the sheet costs Sheets quota, so skip it when the ledger has nothing to write
+    if not inventory_ledger.has_pending():
+        return
+    new_stocks = inventory_ledger.flush(get_inventory_sheet(get_client()))
+    if new_stocks:
+        logging.info(f"[STOCK] Wrote {len(new_stocks)} ledger-adjusted SKU(s) back to the inventory sheet")
+
+def cleanup_job():
+    cleanup_old_orders()
+    cleanup_old_logs()
+
+def forecast_job():
+    inventory = state["snapshot"]["inventory"] if state["snapshot"] else None
+    if inventory is None:
+        inventory = load_inventory_from_sheets(get_client())
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        forecasts = forecast.run_forecast(conn, get_kits(), inventory)
+        logging.info(f"📈 Computed forecasts for {len(forecasts)} SKUs")
+    finally:
+        conn.close()
+
+JOBS = {
+    "shipstation": {"func": shipstation_job, "interval": SHIPSTATION_INTERVAL, "next_run": 0.0},
+    "shopify": {"func": shopify_job, "interval": SHOPIFY_INTERVAL, "next_run": 0.0},
+    "ledger": {"func": ledger_job, "interval": LEDGER_FLUSH_INTERVAL, "next_run": 0.0},
+    "forecast": {"func": forecast_job, "interval": FORECAST_INTERVAL, "next_run": 0.0},
+    "cleanup": {"func": cleanup_job, "interval": CLEANUP_INTERVAL, "next_run": 0.0}
+}
+
+def run_job(name):
+    job = JOBS[name]
+    logging.info(f"[JOB] ▶️ {name} started")
+    started = time.time()
+    try:
+        with profiling.profile_run(f"job_{name}"):
+            job["func"]()
+        logging.info(f"[JOB] ✅ {name} finished in {time.time() - started:.1f}s")
+    except Exception as e:
+        logging.error(f"[JOB] ❌ {name} failed after {time.time() - started:.1f}s: {e}")
+        # Drop warm clients so the next run re-authenticates instead of reusing a broken session
+        state["client"] = None
+    # Schedule from the finish time so a slow run can never overlap its next one
+    if job["next_run"] <= started:
+        job["next_run"] = time.time() + job["interval"]
+
+def run_forever():
+    """
+    Runs every job in this one process, one at a time, each on its own interval.
+    Jobs run sequentially on the main thread, so two jobs never overlap.
+    """
+    logging.info("🚀 Orchestrator started: " + ", ".join(
+        f"{name} every {job['interval'] // 60} min" for name, job in JOBS.items()
+    ))
+    while True:
+        now = time.time()
+        due = [name for name, job in JOBS.items() if job["next_run"] <= now]
+        if not due:
+            time.sleep(min(TICK_SECONDS, max(min(j["next_run"] for j in JOBS.values()) - now, 0)))
+            continue
+        run_job(min(due, key=lambda name: JOBS[name]["next_run"]))
+
+if __name__ == "__main__":
+    profiling.configure()
+    setup_logging()
+    state["stores"] = shopify_sync.load_store_configs()
+    if not state["stores"]:
+        logging.warning("[WARN] No Shopify stores configured; the Shopify push will be skipped")
+        del JOBS["shopify"]
+    try:
+        run_forever()
+    except KeyboardInterrupt:
+        logging.info("🛑 Orchestrator stopped")
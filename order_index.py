@@ -0,0 +1,81 @@
+# -----------------------------
+# 📁 order_index.py (Payment-date bucketed order index for instant date-range queries)
+# -----------------------------
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date
+import numpy as np
+from fulfillment import get_sku_totals
+
+FIELDS = ("total", "from_kits", "standalone")
+
+def parse_payment_day(order):
+    """The order's payment date as a date, or None if it's missing or malformed."""
+    payment_date_str = order.get("paymentDate")
+    if not payment_date_str:
+        return None
+    try:
+        return date.fromisoformat(payment_date_str[:10])
+    except ValueError:
+        return None
+
+class OrderIndex:
+    """
+    Orders bucketed by payment day with per-day SKU demand pre-aggregated for both
+    view modes. Buckets are stored as running totals, so any [start, end] query is
+    two bisects and one array subtraction regardless of how many orders there are.
+    """
+
+    def __init__(self, orders, kits, inventory):
+        self.inventory_skus = set(inventory)
+        buckets = defaultdict(list)
+        for order in orders:
+            day = parse_payment_day(order)
+            if day is not None:
+                buckets[day].append(order)
+
+        self.days = sorted(buckets)
+        self._order_counts = np.concatenate(([0], np.cumsum([len(buckets[d]) for d in self.days])))
+        self._views = {}
+        for separate_virtual in (False, True):
+            daily = [get_sku_totals(buckets[d], kits, inventory, separate_virtual) for d in self.days]
+            skus = sorted({sku for totals in daily for sku in totals})
+            sku_idx = {sku: i for i, sku in enumerate(skus)}
+            # Row 0 stays zero so cum[hi] - cum[lo] works for ranges starting at the first day
+            cum = np.zeros((len(self.days) + 1, len(skus), len(FIELDS)))
+            for t, totals in enumerate(daily, start=1):
+                for sku, values in totals.items():
+                    cum[t, sku_idx[sku]] = [values[f] for f in FIELDS]
+            np.cumsum(cum, axis=0, out=cum)
+            self._views[separate_virtual] = (skus, sku_idx, cum)
+
+    def matches(self, inventory):
+        """True if the index was built against the same inventory SKUs (which decide kit handling)."""
+        return inventory.keys() == self.inventory_skus
+
+    def _bounds(self, start_date, end_date):
+        return bisect_left(self.days, start_date), bisect_right(self.days, end_date)
+
+    def order_count(self, start_date, end_date):
+        lo, hi = self._bounds(start_date, end_date)
+        return int(self._order_counts[max(hi, lo)] - self._order_counts[lo])
+
+    def demand(self, start_date, end_date, separate_virtual=False):
+        """
+        Demand for the orders paid between start_date and end_date as arrays:
+        (sku -> row position, matrix with one row per SKU and one column per FIELDS entry).
+        """
+        skus, sku_idx, cum = self._views[separate_virtual]
+        lo, hi = self._bounds(start_date, end_date)
+        if hi <= lo:
+            return sku_idx, np.zeros((len(skus), len(FIELDS)))
+        return sku_idx, cum[hi] - cum[lo]
+
+    def sku_totals(self, start_date, end_date, separate_virtual=False):
+        """Same result as get_sku_totals over the orders paid between start_date and end_date."""
+        skus = self._views[separate_virtual][0]
+        _, window = self.demand(start_date, end_date, separate_virtual)
+        return {
+            skus[i]: dict(zip(FIELDS, window[i].tolist()))
+            for i in np.flatnonzero(np.abs(window).sum(axis=1))
+        }
@@ -0,0 +1,168 @@
+# -----------------------------
+# 📁 order_store.py (Normalized order-line history in order_log.db)
+# -----------------------------
+import sqlite3
+from datetime import date
+
+DB_PATH = "order_log.db"
+
+def connect(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    init_order_lines(conn)
+    return conn
+
+ORDER_LINES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS order_lines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id TEXT NOT NULL,
+        sku TEXT NOT NULL,
+        kit_sku TEXT NOT NULL DEFAULT '',
+        qty REAL NOT NULL,
+        kit_qty REAL,
+        ship_date TEXT NOT NULL,
+        source TEXT NOT NULL,
+        UNIQUE (order_id, sku, kit_sku)
+    )
+"""
+
+def _migrate_order_lines(conn):
+    """
+    Older databases keyed order_lines by (order_id, sku, kit_sku) on implicit rowids,
+    which SQLite hands out again after deletes. Rebuilds the table with an AUTOINCREMENT
+    id, keeping each row's rowid as its id so incremental readers stay in step.
+    """
+    c = conn.cursor()
+    c.execute("SAVEPOINT migrate_order_lines")
+    c.execute("ALTER TABLE order_lines RENAME TO order_lines_old")
+    c.execute(ORDER_LINES_SCHEMA)
+    c.execute("""
+        INSERT INTO order_lines (id, order_id, sku, kit_sku, qty, kit_qty, ship_date, source)
+        SELECT rowid, order_id, sku, kit_sku, qty, kit_qty, ship_date, source FROM order_lines_old
+    """)
+    c.execute("DROP TABLE order_lines_old")
+    # Rowids may already have been reused up to the rollup watermark; start new ids above it
+    has_state = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollup_state'").fetchone()
+    watermark = has_state and c.execute(
+        "SELECT value FROM rollup_state WHERE name = 'order_lines_rowid'"
+    ).fetchone()
+    if watermark:
+        c.execute("DELETE FROM sqlite_sequence WHERE name = 'order_lines'")
+        c.execute(
+            "INSERT INTO sqlite_sequence (name, seq) VALUES ('order_lines', MAX(?, (SELECT COALESCE(MAX(id), 0) FROM order_lines)))",
+            (watermark[0],)
+        )
+    c.execute("RELEASE migrate_order_lines")
+
+def init_order_lines(conn):
+    """Creates the order_lines tables and their indexes if they don't exist yet."""
+    c = conn.cursor()
+    columns = {row[1] for row in c.execute("PRAGMA table_info(order_lines)")}
+    if columns and "id" not in columns:
+        _migrate_order_lines(conn)
+    c.execute(ORDER_LINES_SCHEMA)
+    # Lines a re-sync replaced, so rollups can recompute the days they were counted in
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS order_lines_replaced (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sku TEXT NOT NULL,
+            kit_sku TEXT NOT NULL,
+            ship_date TEXT NOT NULL,
+            source TEXT NOT NULL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_order_lines_sku_date ON order_lines (sku, ship_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_order_lines_date ON order_lines (ship_date)")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_order_lines_kit_date ON order_lines (kit_sku, ship_date) WHERE source = 'kit'"
+    )
+    conn.commit()
+
+def explode_order_items(items, kits, inventory):
+    """
+    Turns ShipStation order items into stock-deducting lines.
+
+    Virtual kits (in kits but not in inventory) are exploded into their components
+    with source "kit"; everything else is a "standalone" line on the ordered SKU.
+    Lines are aggregated per (sku, kit_sku) so each order holds one row per pair.
+    """
+    lines = {}
+    for item in items:
+        sku = (item.get("sku") or "").strip().upper()
+        qty = item.get("quantity", 0)
+        if not sku:
+            continue
+
+        if sku in kits and sku not in inventory:
+            for comp in kits[sku]:
+                comp_sku = comp["sku"].strip().upper()
+                line = lines.setdefault((comp_sku, sku), {
+                    "sku": comp_sku, "kit_sku": sku, "qty": 0.0, "kit_qty": 0.0, "source": "kit"
+                })
+                line["qty"] += qty * float(comp["qty"])
+                line["kit_qty"] += qty
+        else:
+            line = lines.setdefault((sku, ""), {
+                "sku": sku, "kit_sku": "", "qty": 0.0, "kit_qty": None, "source": "standalone"
+            })
+            line["qty"] += qty
+
+    return list(lines.values())
+
+def lines_to_sku_changes(lines):
+    """Collapses order lines into the {sku: qty} deltas applied to the inventory sheet."""
+    changes = {}
+    for line in lines:
+        changes[line["sku"]] = changes.get(line["sku"], 0) + line["qty"]
+    return changes
+
+def insert_order_lines(conn, order_id, ship_date, lines):
+    """
+    Writes one order's lines, replacing any it already had (a re-synced order).
+    Does not commit, so callers can pair it with processed_orders.
+    """
+    ship_day = ship_date.isoformat() if isinstance(ship_date, date) else str(ship_date)
+    replaced = conn.execute("""
+        INSERT INTO order_lines_replaced (sku, kit_sku, ship_date, source)
+        SELECT sku, kit_sku, ship_date, source FROM order_lines WHERE order_id = ?
+    """, (order_id,))
+    if replaced.rowcount:
+        conn.execute("DELETE FROM order_lines WHERE order_id = ?", (order_id,))
+    conn.executemany(
+        "INSERT INTO order_lines (order_id, sku, kit_sku, qty, kit_qty, ship_date, source) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (order_id, line["sku"], line["kit_sku"], line["qty"], line["kit_qty"], ship_day, line["source"])
+            for line in lines
+        ]
+    )
+
+def get_order_lines(conn, start_date, end_date, sku=None):
+    """Returns order lines shipped between start_date and end_date (inclusive)."""
+    where = "ship_date BETWEEN ? AND ?"
+    params = [start_date.isoformat(), end_date.isoformat()]
+    if sku:
+        where = "sku = ? AND " + where
+        params.insert(0, sku.strip().upper())
+    query = (
+        "SELECT order_id, sku, kit_sku, qty, kit_qty, ship_date, source FROM order_lines "
+        f"WHERE {where}"
+    )
+    cur = conn.execute(query + " ORDER BY ship_date", params)
+    columns = [d[0] for d in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+def get_shipped_sku_totals(conn, start_date, end_date):
+    """Per-SKU shipped totals in the same shape the dashboard uses for open-order demand."""
+    cur = conn.execute("""
+        SELECT sku,
+               SUM(qty),
+               SUM(CASE WHEN source = 'kit' THEN qty ELSE 0 END),
+               SUM(CASE WHEN source = 'standalone' THEN qty ELSE 0 END)
+        FROM order_lines
+        WHERE ship_date BETWEEN ? AND ?
+        GROUP BY sku
+    """, (start_date.isoformat(), end_date.isoformat()))
+    return {
+        sku: {"total": total, "from_kits": from_kits, "standalone": standalone}
+        for sku, total, from_kits, standalone in cur.fetchall()
+    }
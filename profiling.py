@@ -0,0 +1,221 @@
+# -----------------------------
+# 📁 profiling.py (Opt-in profiling: cProfile, stack sampling and hot-path timers)
+# -----------------------------
+import cProfile
+import contextvars
+import functools
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import config
+
+# PROFILE=cprofile (deterministic), sample (low-overhead stack sampling) or all; 1/true means cprofile.
+# Scripts also accept --profile[=mode]. Unset, every hook below is a no-op.
+PROFILE_DIR = os.path.join("logs", "profiles")
+# Default for PROFILE_SAMPLE_MS
+SAMPLE_MS = 5
+MODES = ("cprofile", "sample", "all")
+
+_mode = None
+_configured = False
+_configure_lock = threading.Lock()
+# The running session's {timer name: [calls, total s, max s]}; each Streamlit session and
+# orchestrator job runs on its own thread, so concurrent sessions never share one
+_session_timers = contextvars.ContextVar("profile_timers", default=None)
+# cProfile can only profile one thread at a time; concurrent app reruns fall back to sampling
+_cprofile_lock = threading.Lock()
+_NULL = nullcontext()
+
+def _parse_mode(value):
+    value = (value or "").strip().lower()
+    if value in ("", "0", "false", "off", "no"):
+        return None
+    if value in ("1", "true", "on", "yes"):
+        return "cprofile"
+    if value not in MODES:
+        logging.warning(f"[PROFILE] Unknown profiling mode '{value}', using cprofile")
+        return "cprofile"
+    return value
+
+def configure(argv=None, strip=True):
+    """
+    Turns profiling on from the PROFILE env var or a --profile[=mode] argument.
+    With strip, the flag is removed from argv so scripts that parse their own arguments don't see it.
+    """
+    global _mode, _configured
+    mode = _parse_mode(config.get("PROFILE"))
+    argv = sys.argv if argv is None else argv
+    for arg in list(argv[1:]):
+        if arg == "--profile" or arg.startswith("--profile="):
+            mode = _parse_mode(arg.partition("=")[2] or "cprofile")
+            if strip:
+                argv.remove(arg)
+    # Set the mode before the flag: start() checks the flag without taking the lock
+    _mode = mode
+    _configured = True
+    return _mode
+
+def configure_once():
+    """
+    configure() for processes that re-run the caller's code (Streamlit reruns app.py):
+    only the first call reads the env and sys.argv, which is left untouched.
+    """
+    with _configure_lock:
+        if not _configured:
+            configure(strip=False)
+    return _mode
+
+def enabled():
+    return _mode is not None
+
+# --- Hot-path timers ---
+class _Timer:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        timers = _session_timers.get()
+        if timers is not None:
+            stats = timers.setdefault(self.name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+        return False
+
+def timer(name):
+    """Context manager that adds wall time under `name` to the profile session running on this thread."""
+    return _Timer(name) if _mode else _NULL
+
+def timed(name=None):
+    """Decorator version of timer(); the wrapper is a single flag check when profiling is off."""
+    def decorator(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _mode:
+                return func(*args, **kwargs)
+            with _Timer(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def timer_report(timers):
+    """[(name, calls, total seconds, max seconds)] slowest first for one session's timers."""
+    rows = [(name, calls, total, longest) for name, (calls, total, longest) in timers.items()]
+    return sorted(rows, key=lambda row: row[2], reverse=True)
+
+# --- Stack sampling ---
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+class _Sampler(threading.Thread):
+    """Samples one thread's stack every PROFILE_SAMPLE_MS milliseconds into collapsed-stack counts."""
+
+    def __init__(self, thread_id):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.interval = float(config.get("PROFILE_SAMPLE_MS", SAMPLE_MS)) / 1000
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+# --- Sessions ---
+class ProfileSession:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.timers = {}
+        self._timers_token = _session_timers.set(self.timers)
+        self.profiler = None
+        self.sampler = None
+        if _mode in ("cprofile", "all") and _cprofile_lock.acquire(blocking=False):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if _mode in ("sample", "all") or (_mode and self.profiler is None):
+            self.sampler = _Sampler(threading.get_ident())
+            self.sampler.start()
+
+    def stop(self):
+        """Stops profiling and writes pstats, collapsed stacks and the timer summary. Returns the file prefix."""
+        elapsed = time.perf_counter() - self.started
+        _session_timers.reset(self._timers_token)
+        # A session started inside another still counts toward the outer one
+        outer = _session_timers.get()
+        if outer is not None:
+            for name, (calls, total, longest) in self.timers.items():
+                stats = outer.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += calls
+                stats[1] += total
+                stats[2] = max(stats[2], longest)
+        if self.profiler is not None:
+            self.profiler.disable()
+            _cprofile_lock.release()
+        if self.sampler is not None:
+            self.sampler.stopped.set()
+            self.sampler.join()
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        prefix = os.path.join(PROFILE_DIR, f"{self.name}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')}")
+        if self.profiler is not None:
+            self.profiler.dump_stats(f"{prefix}.pstats")
+            logging.info(f"[PROFILE] {len(pstats.Stats(self.profiler).stats)} functions profiled → {prefix}.pstats")
+        if self.sampler is not None:
+            # One "frame;frame;frame count" line per stack: flamegraph.pl, speedscope and inferno read it as-is
+            with open(f"{prefix}.collapsed", "w", encoding="utf-8") as f:
+                for stack, count in self.sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            logging.info(f"[PROFILE] {sum(self.sampler.stacks.values())} stack samples → {prefix}.collapsed")
+
+        report = timer_report(self.timers)
+        with open(f"{prefix}_timers.txt", "w", encoding="utf-8") as f:
+            f.write(f"{self.name}: {elapsed:.3f}s wall\n")
+            f.write(f"{'timer':<40} {'calls':>8} {'total s':>10} {'max s':>10}\n")
+            for name, calls, total, longest in report:
+                f.write(f"{name:<40} {calls:>8} {total:>10.3f} {longest:>10.3f}\n")
+        for name, calls, total, longest in report[:10]:
+            logging.info(f"[PROFILE] {name}: {calls} call(s), {total:.3f}s total, {longest:.3f}s max")
+        return prefix
+
+def start(name):
+    """
+    Starts a profile session, or returns None when profiling is off. Nothing is
+    read at import; a process that never called configure() is set up here.
+    """
+    if not _configured:
+        configure_once()
+    return ProfileSession(name) if _mode else None
+
+def stop(session):
+    return session.stop() if session is not None else None
+
+@contextmanager
+def profile_run(name):
+    """Profiles the enclosed block when profiling is on; otherwise does nothing."""
+    session = start(name)
+    try:
+        yield session
+    finally:
+        stop(session)
@@ -0,0 +1,199 @@
+# -----------------------------
+# 📁 rate_governor.py (Shared adaptive token buckets for Shopify, ShipStation and Sheets calls)
+# -----------------------------
+import hashlib
+import logging
+import threading
+import time
+import config
+
+# Documented defaults; each bucket re-tunes itself from the API's response headers.
+# (capacity, refill per second)
+DEFAULT_LIMITS = {
+    # REST leaky bucket: 40 calls, 2/s restore (Plus stores report 400 and get 20/s, see observe_shopify)
+    "shopify": (40, 2.0),
+    # 40 requests per minute per API key
+    "shipstation": (40, 40 / 60)
+}
+# Sheets read/write quota per user per minute, overridable with SHEETS_REQUESTS_PER_MIN
+SHEETS_REQUESTS_PER_MIN = "60"
+MAX_RETRIES = 5
+
+class RateLimited(Exception):
+    """A call was still throttled (HTTP 429) after every retry; the caller should try it again later."""
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+class TokenBucket:
+    """
+    A thread-safe token bucket. acquire() reserves tokens up front (the balance may
+    go negative) and sleeps outside the lock, so concurrent workers queue fairly on
+    one shared budget instead of all waking at once.
+    """
+
+    def __init__(self, name, capacity, rate, api=None):
+        self.name = name
+        self.api = api
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "waits": 0, "wait_seconds": 0.0, "throttled": 0}
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cost=1):
+        """Blocks until `cost` tokens are available. Returns the seconds spent waiting."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= cost
+            wait = max(-self.tokens / self.rate if self.tokens < 0 else 0.0, self.blocked_until - now)
+            self.stats["requests"] += 1
+            if wait > 0:
+                self.stats["waits"] += 1
+                self.stats["wait_seconds"] += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def observe(self, remaining=None, limit=None, rate=None, reset_in=None):
+        """Re-syncs the bucket with what the server reports about the caller's budget."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.capacity = float(limit)
+            if rate:
+                self.rate = float(rate)
+            if remaining is not None:
+                # Never trust the server's count over our own reservations, only tighten
+                self.tokens = min(self.tokens, float(remaining))
+                if remaining <= 0 and reset_in:
+                    self.blocked_until = max(self.blocked_until, now + float(reset_in))
+
+    def throttled(self, retry_after):
+        """Records a 429: drains the bucket and blocks every caller for retry_after seconds."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = now
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.stats["throttled"] += 1
+
+def _credential_label(credential):
+    # Buckets are per credential, but secrets never end up in keys or logs
+    return hashlib.sha1(str(credential).encode()).hexdigest()[:8]
+
+def get_bucket(api, credential="default", label=None):
+    """The shared bucket for one API and credential, created with that API's defaults."""
+    key = (api, _credential_label(credential))
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            if api == "sheets":
+                per_min = int(config.get("SHEETS_REQUESTS_PER_MIN", SHEETS_REQUESTS_PER_MIN))
+                capacity, rate = per_min, per_min / 60
+            else:
+                capacity, rate = DEFAULT_LIMITS[api]
+            bucket = TokenBucket(f"{api}:{label or key[1]}", capacity, rate, api)
+            _buckets[key] = bucket
+        return bucket
+
+def shopify_bucket(store):
+    return get_bucket("shopify", store["shop_url"], label=store.get("name") or store["shop_url"])
+
+def shipstation_bucket(api_key):
+    return get_bucket("shipstation", api_key)
+
+def sheets_bucket():
+    return get_bucket("sheets", "service_account", label="service_account")
+
+# --- Header adapters ---
+def observe_shopify(bucket, response):
+    """X-Shopify-Shop-Api-Call-Limit: "used/total"; the restore rate scales with the bucket size."""
+    call_limit = response.headers.get("X-Shopify-Shop-Api-Call-Limit")
+    if not call_limit:
+        return
+    try:
+        used, total = map(int, call_limit.split("/"))
+    except ValueError:
+        return
+    bucket.observe(remaining=total - used, limit=total, rate=total / 20)
+
+def observe_shipstation(bucket, response):
+    """X-Rate-Limit-Limit / -Remaining / -Reset (seconds until the window resets)."""
+    headers = response.headers
+    try:
+        limit = int(headers["X-Rate-Limit-Limit"])
+        remaining = int(headers["X-Rate-Limit-Remaining"])
+        reset_in = int(headers.get("X-Rate-Limit-Reset", 60))
+    except (KeyError, ValueError):
+        return
+    bucket.observe(remaining=remaining, limit=limit, rate=limit / 60, reset_in=reset_in)
+
+OBSERVERS = {"shopify": observe_shopify, "shipstation": observe_shipstation}
+
+def retry_after_seconds(response, attempt):
+    try:
+        return max(float(response.headers.get("Retry-After", "")), 0.5)
+    except ValueError:
+        return min(2 ** attempt, 60)
+
+def request(bucket, method, url, max_retries=MAX_RETRIES, **kwargs):
+    """
+    requests.request() through the bucket: waits for budget, adapts to the
+    response's rate headers and retries 429s after Retry-After. Returns the last response.
+    """
+    import requests
+
+    for attempt in range(max_retries):
+        bucket.acquire()
+        response = requests.request(method, url, **kwargs)
+        observer = OBSERVERS.get(bucket.api)
+        if observer:
+            observer(bucket, response)
+        if response.status_code != 429:
+            return response
+        wait = retry_after_seconds(response, attempt)
+        bucket.throttled(wait)
+        logging.warning(f"[RETRY] {bucket.name} rate limited; waiting {wait:.1f}s ({attempt + 1}/{max_retries})")
+    return response
+
+def sheets_call(func, *args, cost=1, **kwargs):
+    """Runs one gspread call within the Sheets quota, retrying quota errors (HTTP 429)."""
+    from gspread.exceptions import APIError
+
+    bucket = sheets_bucket()
+    for attempt in range(MAX_RETRIES):
+        bucket.acquire(cost)
+        try:
+            return func(*args, **kwargs)
+        except APIError as e:
+            if getattr(e, "code", None) != 429 or attempt == MAX_RETRIES - 1:
+                raise
+            wait = min(2 ** attempt * 5, 60)
+            bucket.throttled(wait)
+            logging.warning(f"[RETRY] Sheets quota exceeded; waiting {wait}s ({attempt + 1}/{MAX_RETRIES})")
+
+def stats():
+    """{bucket name: {"requests", "waits", "wait_seconds", "throttled"}} since process start."""
+    with _buckets_lock:
+        buckets = list(_buckets.values())
+    result = {}
+    for bucket in buckets:
+        with bucket.lock:
+            result[bucket.name] = dict(bucket.stats)
+    return result
+
+def log_stats():
+    for name, s in stats().items():
+        logging.info(
+            f"[RATE] {name}: {s['requests']} request(s), waited {s['wait_seconds']:.1f}s over "
+            f"{s['waits']} wait(s), {s['throttled']} throttled"
+        )
@@ -0,0 +1,19 @@
+@echo off
+setlocal
+
+:: === CONFIG ===
+set BASE_DIR=%~dp0
+set LOG_DIR=%BASE_DIR%logs
+set PYTHON_EXEC=python
+
+:: Ensure logs directory exists
+if not exist "%LOG_DIR%" mkdir "%LOG_DIR%"
+
+:: Long-running scheduler: ShipStation deduction, Shopify push, forecasts and cleanup
+:: all run in this one process on their own intervals (see orchestrator.py)
+cd /d "%BASE_DIR%"
+echo [%date% %time%] Starting orchestrator.py >> "%LOG_DIR%\\sync_runner.log"
+%PYTHON_EXEC% "%BASE_DIR%orchestrator.py" >> "%LOG_DIR%\\orchestrator_output.log" 2>&1
+echo [%date% %time%] orchestrator.py exited with code %ERRORLEVEL% >> "%LOG_DIR%\\sync_runner.log"
+
+endlocal
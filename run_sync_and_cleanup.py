@@ -1,9 +1,10 @@
 import logging
-import subprocess
 import sys
 import os
-import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
+from maintenance import purge_old_orders, rotate_logs
+import shipstation_sync
+import profiling
 
 # === Settings ===
 DB_PATH = "order_log.db"
@@ -11,63 +12,47 @@ LOG_DIR = "logs"
 DAYS_TO_KEEP = 60
 
 # === Logging Setup ===
-os.makedirs(LOG_DIR, exist_ok=True)
-log_filename = datetime.now().strftime("combined_sync_%Y-%m-%d_%H-%M-%S.log")
-log_path = os.path.join(LOG_DIR, log_filename)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-    handlers=[
-        logging.FileHandler(log_path, encoding="utf-8"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+def setup_logging():
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_filename = datetime.now().strftime("combined_sync_%Y-%m-%d_%H-%M-%S.log")
+    log_path = os.path.join(LOG_DIR, log_filename)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(message)s",
+        handlers=[
+            logging.FileHandler(log_path, encoding="utf-8"),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
 
 def run_shipstation_sync():
     logging.info("🚀 Running ShipStation Sync...")
     try:
-        subprocess.run(["python", "shipstation_sync.py"], check=True)
+        shipstation_sync.run_sync()
         logging.info("✅ ShipStation Sync completed successfully.")
-    except subprocess.CalledProcessError as e:
+    except Exception as e:
         logging.error(f"❌ ShipStation Sync failed: {e}")
 
 def cleanup_old_orders():
     logging.info("🧹 Cleaning old DB entries...")
     try:
-        cutoff = (datetime.now() - timedelta(days=DAYS_TO_KEEP)).isoformat()
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-
-        cur.execute("SELECT COUNT(*) FROM processed_orders WHERE processed_at < ?", (cutoff,))
-        count = cur.fetchone()[0]
-
-        if count > 0:
-            cur.execute("DELETE FROM processed_orders WHERE processed_at < ?", (cutoff,))
-            conn.commit()
-            logging.info(f"✅ Deleted {count} rows older than {DAYS_TO_KEEP} days.")
-        else:
-            logging.info("📭 No old rows to delete.")
-        conn.close()
+        purge_old_orders(DB_PATH, DAYS_TO_KEEP)
     except Exception as e:
         logging.error(f"❌ DB cleanup failed: {e}")
 
 def cleanup_old_logs():
-    logging.info("🧹 Checking for old .log files...")
+    logging.info("🧹 Rotating and compressing log files...")
     try:
-        now = datetime.now()
-        for fname in os.listdir(LOG_DIR):
-            if fname.endswith(".log"):
-                fpath = os.path.join(LOG_DIR, fname)
-                mtime = datetime.fromtimestamp(os.path.getmtime(fpath))
-                if now - mtime > timedelta(days=DAYS_TO_KEEP):
-                    os.remove(fpath)
-                    logging.info(f"🗑️ Deleted log file: {fname}")
+        rotate_logs(LOG_DIR, DAYS_TO_KEEP)
     except Exception as e:
         logging.error(f"❌ Log file cleanup failed: {e}")
 
 # === Main Execution ===
 if __name__ == "__main__":
-    run_shipstation_sync()
-    cleanup_old_orders()
-    cleanup_old_logs()
+    profiling.configure()
+    setup_logging()
+    with profiling.profile_run("combined_sync"):
+        run_shipstation_sync()
+        cleanup_old_orders()
+        cleanup_old_logs()
@@ -1,32 +1,29 @@
 # -----------------------------
 # 📁 sheet_loader.py (Updated with virtual kit + inventory SKU loader)
 # -----------------------------
-import gspread
-import json
-import os
 from collections import defaultdict
-from oauth2client.service_account import ServiceAccountCredentials
-import streamlit as st
+import config
+from profiling import timed
+from rate_governor import sheets_call
 
 def get_gspread_client():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-
-    try:
-        if "gspread_key" in st.secrets:
-            creds_dict = dict(st.secrets["gspread_key"])
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        else:
-            raise KeyError("gspread_key not found in st.secrets")
-    except Exception:
-        with open("gspread_key.json") as f:
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(json.load(f), scope)
+    # gspread and oauth2client are only imported once a client is actually needed
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
 
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(config.get_gspread_key(), scope)
     return gspread.authorize(creds)
 
-def load_kits_from_sheets():
-    client = get_gspread_client()
-    sheet = client.open("Kit BOMs").worksheet("kits")
-    rows = sheet.get_all_records()
+def open_worksheet(client, name):
+    # Opening the spreadsheet and looking up the tab are two API requests
+    return sheets_call(lambda: client.open("Kit BOMs").worksheet(name), cost=2)
+
+@timed("sheets.load_kits")
+def load_kits_from_sheets(client=None):
+    client = client or get_gspread_client()
+    sheet = open_worksheet(client, "kits")
+    rows = sheets_call(sheet.get_all_records)
     kits = defaultdict(list)
     for row in rows:
         try:
@@ -42,10 +39,16 @@ def load_kits_from_sheets():
         })
     return dict(kits)
 
-def load_inventory_from_sheets():
-    client = get_gspread_client()
-    sheet = client.open("Kit BOMs").worksheet("inventory")
-    rows = sheet.get_all_records()
+def get_inventory_sheet(client=None):
+    client = client or get_gspread_client()
+    return open_worksheet(client, "inventory")
+
+@timed("sheets.load_inventory")
+def load_inventory_from_sheets(client=None):
+    return parse_inventory_rows(sheets_call(get_inventory_sheet(client).get_all_records))
+
+def parse_inventory_rows(rows):
+    """Builds the {sku: {"stock", "name"}} map from the inventory worksheet's records."""
     inventory = {}
     for row in rows:
         sku = row["SKU"].strip().upper()
@@ -55,10 +58,10 @@ def load_inventory_from_sheets():
         }
     return inventory
 
-def update_inventory_quantity(sku, qty_to_add):
-    client = get_gspread_client()
-    sheet = client.open("Kit BOMs").worksheet("inventory")
-    rows = sheet.get_all_records()
+def update_inventory_quantity(sku, qty_to_add, client=None):
+    client = client or get_gspread_client()
+    sheet = open_worksheet(client, "inventory")
+    rows = sheets_call(sheet.get_all_records)
     for idx, row in enumerate(rows, start=2):
         if row["SKU"].strip().upper() == sku.strip().upper():
             try:
@@ -66,15 +69,15 @@ def update_inventory_quantity(sku, qty_to_add):
             except:
                 current_qty = 0.0
             new_qty = current_qty + qty_to_add
-            sheet.update_cell(idx, 3, new_qty)
+            sheets_call(sheet.update_cell, idx, 3, new_qty)
             return {"success": True, "old_qty": current_qty, "new_qty": new_qty}
     return {"success": False}
 
-def load_inflation_rules():
-    client = get_gspread_client()
+def load_inflation_rules(client=None):
+    client = client or get_gspread_client()
     try:
-        sheet = client.open("Kit BOMs").worksheet("inflation_rules")
-        rows = sheet.get_all_records()
+        sheet = open_worksheet(client, "inflation_rules")
+        rows = sheets_call(sheet.get_all_records)
         store2_inflated = set(
             row["SKU"].strip().upper()
             for row in rows
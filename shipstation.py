@@ -1,19 +1,23 @@
 # -----------------------------
-# 📁 shipstation.py (Streamlit-ready)
+# 📁 shipstation.py (ShipStation order fetches for the dashboard)
 # -----------------------------
 import requests
 import base64
-import streamlit as st
+import config
+import rate_governor
+
+def get_credentials():
+    return config.get("SHIPSTATION_API_KEY"), config.get("SHIPSTATION_API_SECRET")
 
 def get_orders(order_status="awaiting_shipment"):
-    API_KEY = st.secrets["SHIPSTATION_API_KEY"]
-    API_SECRET = st.secrets["SHIPSTATION_API_SECRET"]
+    API_KEY, API_SECRET = get_credentials()
     url = 'https://ssapi.shipstation.com/orders'
     auth = base64.b64encode(f"{API_KEY}:{API_SECRET}".encode()).decode()
     headers = {
         'Authorization': f'Basic {auth}',
         'Content-Type': 'application/json'
     }
+    bucket = rate_governor.shipstation_bucket(API_KEY)
     all_orders = []
     page = 1
     total_pages = 1
@@ -26,7 +30,7 @@ def get_orders(order_status="awaiting_shipment"):
             'orderStatus': order_status
         }
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = rate_governor.request(bucket, "GET", url, headers=headers, params=params)
             response.raise_for_status()
             data = response.json()
             all_orders.extend(data.get('orders', []))
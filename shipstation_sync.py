@@ -2,49 +2,45 @@ import requests
 import base64
 import sqlite3
 from datetime import datetime, date
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import json
-from dotenv import load_dotenv
 import os
 import logging
 import sys
 import time
-from gspread.exceptions import APIError
-from sheet_loader import load_kits_from_sheets, load_inventory_from_sheets
-
-# Create logs folder and timestamped log file
-LOG_DIR = "logs"
-os.makedirs(LOG_DIR, exist_ok=True)
-log_filename = datetime.now().strftime("shipstation_sync_%Y-%m-%d_%H-%M-%S.log")
-log_path = os.path.join(LOG_DIR, log_filename)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)s | %(message)s',
-    handlers=[
-        logging.FileHandler(log_path, encoding="utf-8"),
-        logging.StreamHandler(sys.stdout)
-    ],
-    force=True
+import config
+from sheet_loader import get_gspread_client, get_inventory_sheet, load_kits_from_sheets, parse_inventory_rows
+from order_store import (
+    DB_PATH,
+    init_order_lines,
+    explode_order_items,
+    lines_to_sku_changes,
+    insert_order_lines
 )
+from demand_rollup import refresh_rollups
+import inventory_ledger
+import profiling
+import rate_governor
+from profiling import timed
 
-# 🔐 Load secrets from .env
-load_dotenv()
-API_KEY = os.getenv("SHIPSTATION_API_KEY")
-API_SECRET = os.getenv("SHIPSTATION_API_SECRET")
-if not API_KEY or not API_SECRET:
-    raise ValueError("Missing SHIPSTATION_API_KEY or SHIPSTATION_API_SECRET in .env")
-
-DB_PATH = "order_log.db"
+LOG_DIR = "logs"
 
-def get_gspread_client():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(json.load(open("gspread_key.json")), scope)
-    return gspread.authorize(creds)
+def setup_logging():
+    """Create logs folder and timestamped log file for a standalone run."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_filename = datetime.now().strftime("shipstation_sync_%Y-%m-%d_%H-%M-%S.log")
+    log_path = os.path.join(LOG_DIR, log_filename)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)s | %(message)s',
+        handlers=[
+            logging.FileHandler(log_path, encoding="utf-8"),
+            logging.StreamHandler(sys.stdout)
+        ],
+        force=True
+    )
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     c = conn.cursor()
     c.execute("""
         CREATE TABLE IF NOT EXISTS processed_orders (
@@ -54,6 +50,8 @@ def init_db():
         )
     """)
     conn.commit()
+    init_order_lines(conn)
+    inventory_ledger.init_ledger(conn)
     return conn
 
 def is_order_processed(conn, order_id):
@@ -61,25 +59,35 @@ def is_order_processed(conn, order_id):
     c.execute("SELECT 1 FROM processed_orders WHERE order_id = ?", (order_id,))
     return c.fetchone() is not None
 
-def log_processed_order(conn, order_id, sku_dict):
+def log_processed_order(conn, order_id, ship_date, lines):
+    """Marks the order processed and records its stock deductions in the ledger, in one transaction."""
     c = conn.cursor()
-    sku_summary = ", ".join(f"{sku}:{qty}" for sku, qty in sku_dict.items())
+    sku_changes = lines_to_sku_changes(lines)
+    sku_summary = ", ".join(f"{sku}:{qty}" for sku, qty in sku_changes.items())
     c.execute("INSERT INTO processed_orders VALUES (?, ?, ?)", (
         order_id,
         datetime.now().isoformat(),
         sku_summary
     ))
+    insert_order_lines(conn, order_id, ship_date, lines)
+    inventory_ledger.insert_events(
+        conn, [(sku, "ship", qty) for sku, qty in sku_changes.items()], source=f"shipstation:{order_id}"
+    )
     conn.commit()
     logging.info(f"✅ Logged order {order_id} → {sku_summary}")
 
+@timed("shipstation.get_shipped_orders")
 def get_shipped_orders():
+    # 🔐 Checked per run rather than at import, so importing this module never fails
+    api_key, api_secret = config.require("SHIPSTATION_API_KEY", "SHIPSTATION_API_SECRET")
     url = 'https://ssapi.shipstation.com/orders'
-    auth = base64.b64encode(f"{API_KEY}:{API_SECRET}".encode()).decode()
+    auth = base64.b64encode(f"{api_key}:{api_secret}".encode()).decode()
     headers = {
         'Authorization': f'Basic {auth}',
         'Content-Type': 'application/json'
     }
 
+    bucket = rate_governor.shipstation_bucket(api_key)
     all_orders = []
     page = 1
     MAX_PAGES = 100
@@ -97,7 +105,8 @@ def get_shipped_orders():
 
         try:
             logging.info(f"🔄 Requesting page {page} from ShipStation...")
-            response = requests.get(url, headers=headers, params=params, timeout=15)
+            with profiling.timer("shipstation.http"):
+                response = rate_governor.request(bucket, "GET", url, headers=headers, params=params, timeout=15)
             response.raise_for_status()
             data = response.json()
 
@@ -119,108 +128,100 @@ def get_shipped_orders():
     logging.info(f"📦 Total shipped orders received: {len(all_orders)}")
     return all_orders
 
-def subtract_from_google_sheet(sheet, data, changes: dict):
-    sku_to_row = {row["SKU"].strip().upper(): idx + 2 for idx, row in enumerate(data)}
-    batch_updates = []
-
-    for sku, delta in changes.items():
-        row_idx = sku_to_row.get(sku)
-        if not row_idx:
-            logging.warning(f"[WARN] SKU {sku} not found in inventory sheet")
-            continue
-
-        old_stock = float(data[row_idx - 2].get("Stock On Hand", 0))
-        new_stock = max(old_stock - delta, 0)
-
-        batch_updates.append({
-            "range": f"C{row_idx}",
-            "values": [[str(new_stock)]]
-        })
-        logging.info(f"[STOCK] {sku}: {old_stock} → {new_stock} (Δ={delta})")
-
-    if not batch_updates:
-        logging.info("[STOCK] No valid SKUs to update.")
-        return
-
+@timed("sheets.ledger_flush")
+def subtract_from_google_sheet(sheet):
+    """Flushes pending ledger events (these deductions included) in one batch update. Returns {sku: new_stock}."""
+    from gspread.exceptions import APIError
     try:
-        sheet.batch_update(batch_updates)
-        logging.info(f"[BATCH] Successfully updated {len(batch_updates)} SKU(s)")
+        new_stocks = inventory_ledger.flush(sheet)
     except APIError as e:
+        # The events stay pending and go out with the next flush
         logging.error(f"[ERROR] GSpread API error during batch update: {e}")
+        return {}
+    if not new_stocks:
+        logging.info("[STOCK] No valid SKUs to update.")
+    return new_stocks
 
-# 🚀 MAIN EXECUTION
-if __name__ == "__main__":
-    logging.info("🚀 ShipStation Sync Started")
+def run_sync(client=None, kits=None):
+    """
+    Deducts today's shipped orders from the inventory sheet.
 
-    try:
-        logging.info("🛠 Initializing database...")
-        conn = init_db()
-        logging.info("✅ Database ready")
+    Pass a warm gspread client and kits to skip re-authenticating and re-reading
+    the BOM sheet. Returns a snapshot {"inventory", "kits", "taken_at"} of the
+    inventory as it stands after the deductions, for the Shopify push to reuse.
+    """
+    logging.info("🛠 Initializing database...")
+    conn = init_db()
+    logging.info("✅ Database ready")
 
+    try:
         logging.info("📄 Loading kits and inventory...")
-        kits = load_kits_from_sheets()
-        inventory = load_inventory_from_sheets()
-
-        client = get_gspread_client()
-        sheet = client.open("Kit BOMs").worksheet("inventory")
+        client = client or get_gspread_client()
+        if kits is None:
+            kits = load_kits_from_sheets(client)
+        sheet = get_inventory_sheet(client)
         sheet_data = sheet.get_all_records()
+        inventory = parse_inventory_rows(sheet_data)
         logging.info("✅ Sheets loaded")
 
         logging.info("🌐 Fetching orders from ShipStation...")
         orders = get_shipped_orders()
         logging.info(f"✅ Retrieved {len(orders)} orders")
-    except Exception as e:
-        logging.error(f"[ERR] Setup failed: {e}")
-        sys.exit(1)
 
-    all_sku_changes = {}
+        for order in orders:
+            order_id = str(order.get("orderId"))
 
-    for order in orders:
-        order_id = str(order.get("orderId"))
+            ship_date_raw = order.get("shipDate") or order.get("modifyDate")
+            if not ship_date_raw:
+                continue
 
-        ship_date_raw = order.get("shipDate") or order.get("modifyDate")
-        if not ship_date_raw:
-            continue
+            try:
+                ship_date = datetime.strptime(ship_date_raw.split("T")[0], "%Y-%m-%d").date()
+            except Exception as e:
+                logging.warning(f"[WARN] Could not parse ship date for order {order_id}: {e}")
+                continue
 
-        try:
-            ship_date = datetime.strptime(ship_date_raw.split("T")[0], "%Y-%m-%d").date()
-        except Exception as e:
-            logging.warning(f"[WARN] Could not parse ship date for order {order_id}: {e}")
-            continue
-
-        if ship_date != date.today():
-            logging.info(f"⏭️ Skipping order {order_id}, shipped on {ship_date} (not today)")
-            continue
-
-        if is_order_processed(conn, order_id):
-            logging.info(f"⏩ Already processed order {order_id}")
-            continue
-
-        logging.info(f"🔧 Processing order {order_id} from {ship_date}")
-
-        sku_changes = {}
-        for item in order.get("items", []):
-            sku = (item.get("sku") or "").strip().upper()
-            qty = item.get("quantity", 0)
-            if not sku:
+            if ship_date != date.today():
+                logging.info(f"⏭️ Skipping order {order_id}, shipped on {ship_date} (not today)")
                 continue
 
-            if sku in kits:
-                if sku in inventory:
-                    sku_changes[sku] = sku_changes.get(sku, 0) + qty
-                else:
-                    for comp in kits[sku]:
-                        comp_sku = comp["sku"].strip().upper()
-                        comp_qty = qty * comp["qty"]
-                        sku_changes[comp_sku] = sku_changes.get(comp_sku, 0) + comp_qty
-            else:
-                sku_changes[sku] = sku_changes.get(sku, 0) + qty
+            if is_order_processed(conn, order_id):
+                logging.info(f"⏩ Already processed order {order_id}")
+                continue
 
-        for sku, delta in sku_changes.items():
-            all_sku_changes[sku] = all_sku_changes.get(sku, 0) + delta
+            logging.info(f"🔧 Processing order {order_id} from {ship_date}")
+
+            with profiling.timer("shipstation.process_order"):
+                lines = explode_order_items(order.get("items", []), kits, inventory)
+                log_processed_order(conn, order_id, ship_date, lines)
+
+        new_stocks = subtract_from_google_sheet(sheet)
+        for sku, new_stock in new_stocks.items():
+            if sku in inventory:
+                inventory[sku] = {**inventory[sku], "stock": new_stock}
+
+        try:
+            rolled = refresh_rollups(conn)
+            logging.info(f"📈 Rolled up {rolled} new order line(s) into daily demand")
+        except sqlite3.Error as e:
+            logging.error(f"[ERROR] Demand rollup failed: {e}")
+    finally:
+        conn.close()
+        rate_governor.log_stats()
 
-        log_processed_order(conn, order_id, sku_changes)
+    return {"inventory": inventory, "kits": kits, "taken_at": time.time()}
+
+# 🚀 MAIN EXECUTION
+if __name__ == "__main__":
+    profiling.configure()
+    setup_logging()
+    logging.info("🚀 ShipStation Sync Started")
+
+    try:
+        with profiling.profile_run("shipstation_sync"):
+            run_sync()
+    except Exception as e:
+        logging.error(f"[ERR] Sync failed: {e}")
+        sys.exit(1)
 
-    subtract_from_google_sheet(sheet, sheet_data, all_sku_changes)
-    conn.close()
     logging.info("✅ ShipStation Sync Completed")
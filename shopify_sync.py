@@ -2,26 +2,31 @@ import os
 import time
 import json
 import logging
-import requests
 import sys
-from dotenv import load_dotenv
+from datetime import datetime
 from requests.exceptions import RequestException
+import config
+import profiling
+import rate_governor
+from profiling import timed
 from sheet_loader import (
+    get_gspread_client,
     load_inventory_from_sheets,
     load_kits_from_sheets,
     load_inflation_rules
 )
 
 # --- Setup ---
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)s | %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("logs/shopify_sync.log", encoding="utf-8")
-    ]
-)
+def setup_logging():
+    os.makedirs("logs", exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)s | %(message)s',
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler("logs/shopify_sync.log", encoding="utf-8")
+        ]
+    )
 
 # Heartbeat log for task health
 heartbeat_log = os.path.join("logs", "sync_runner.log")
@@ -35,29 +40,27 @@ def write_heartbeat(sku, count):
             f.write(f"[HEARTBEAT] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Processing SKU: {sku}\n")
         last_heartbeat_time = now
 
-load_dotenv()
-DRY_RUN = os.getenv("DRY_RUN", "false").lower() == "true"
-logging.info(f"[DEBUG] DRY_RUN = {DRY_RUN}")
+def is_dry_run():
+    return config.get_bool("DRY_RUN")
 
 # --- Shopify store configurations ---
-STORES = []
-for n in ["", "_STORE2"]:
-    url = os.getenv(f"SHOPIFY_SHOP_URL{n}")
-    token = os.getenv(f"SHOPIFY_ACCESS_TOKEN{n}")
-    location_id = os.getenv(f"SHOPIFY_LOCATION_ID{n}")
-    if url and token and location_id:
-        STORES.append({
-            "name": f"Store{n or '1'}",
-            "shop_url": url,
-            "access_token": token,
-            "location_id": location_id
-        })
-
-if not STORES:
-    logging.error("[ERROR] No valid Shopify store credentials found in .env")
-    sys.exit(1)
+def load_store_configs():
+    stores = []
+    for n in ["", "_STORE2"]:
+        url = config.get(f"SHOPIFY_SHOP_URL{n}")
+        token = config.get(f"SHOPIFY_ACCESS_TOKEN{n}")
+        location_id = config.get(f"SHOPIFY_LOCATION_ID{n}")
+        if url and token and location_id:
+            stores.append({
+                "name": f"Store{n or '1'}",
+                "shop_url": url,
+                "access_token": token,
+                "location_id": location_id
+            })
+    return stores
 
 # --- Helpers ---
+@timed("shopify.catalog_crawl")
 def get_inventory_items(store):
     endpoint = f"https://{store['shop_url']}/admin/api/2023-10/products.json?limit=250"
     headers = {
@@ -65,9 +68,11 @@ def get_inventory_items(store):
         "Content-Type": "application/json"
     }
     sku_to_inventory_id = {}
+    bucket = rate_governor.shopify_bucket(store)
 
     while endpoint:
-        resp = requests.get(endpoint, headers=headers)
+        with profiling.timer("shopify.http"):
+            resp = rate_governor.request(bucket, "GET", endpoint, headers=headers)
         resp.raise_for_status()
         products = resp.json().get("products", [])
 
@@ -96,10 +101,12 @@ def get_inventory_items(store):
 
     return sku_to_inventory_id
 
+@timed("shopify.update_level")
 def update_inventory_level(store, sku, inventory_item_id, available, name=None):
+    """Sets one SKU's available stock. Raises rate_governor.RateLimited if Shopify still throttles it after retries."""
     label = f"SKU {sku}" + (f" ({name})" if name else "")
 
-    if DRY_RUN:
+    if is_dry_run():
         logging.info(f"[DRY-RUN] Would update {label} → {available} on {store['name']}")
         return
 
@@ -114,27 +121,20 @@ def update_inventory_level(store, sku, inventory_item_id, available, name=None):
         "available": available
     }
 
+    # Pacing and 429 retries happen in the store's shared rate bucket; this loop only retries network errors
+    bucket = rate_governor.shopify_bucket(store)
     max_retries = 5
     retry = 0
     while retry < max_retries:
         try:
-            response = requests.post(endpoint, headers=headers, json=payload)
-
-            call_limit = response.headers.get("X-Shopify-Shop-Api-Call-Limit")
-            if call_limit:
-                used, total = map(int, call_limit.split("/"))
-                if used >= total - 5:
-                    logging.info(f"[WAIT] API usage {used}/{total}. Sleeping 1s to avoid throttle...")
-                    time.sleep(1)
+            with profiling.timer("shopify.http"):
+                response = rate_governor.request(bucket, "POST", endpoint, headers=headers, json=payload)
 
             if response.status_code == 200:
                 logging.info(f"[OK] Updated {label} to {available} on {store['name']}")
                 return
             elif response.status_code == 429:
-                wait_time = 2 ** retry
-                logging.warning(f"[RETRY] Rate limit hit for {label}. Waiting {wait_time}s before retry {retry + 1}/{max_retries}...")
-                time.sleep(wait_time)
-                retry += 1
+                raise rate_governor.RateLimited(f"Still rate limited updating {label} on {store['name']}")
             else:
                 logging.error(f"[ERROR] Failed to update {label} on {store['name']}: {response.text}")
                 return
@@ -146,59 +146,94 @@ def update_inventory_level(store, sku, inventory_item_id, available, name=None):
 
     logging.error(f"[ERROR] Exhausted retries for {label} on {store['name']}")
 
-# --- Main Execution ---
-if __name__ == "__main__":
-    logging.info("[START] Shopify Inventory Sync" + (" [DRY-RUN]" if DRY_RUN else ""))
-
-    inv_data = load_inventory_from_sheets()
-    kits = load_kits_from_sheets()
-    inflated_skus_store2 = load_inflation_rules()
+@timed("shopify.kit_calc")
+def calculate_kit_stock(norm_sku, components, inv_data):
+    """How many of a virtual kit its components' stock can build, or None if it can't be calculated."""
+    try:
+        component_stocks = []
+        calculated_quantities = []
+
+        for comp in components:
+            comp_sku = comp["sku"].strip().upper()
+            qty_per_kit = comp["qty"]
+            stock_qty = inv_data.get(comp_sku, {}).get("stock", 0)
+
+            if qty_per_kit <= 0:
+                logging.warning(f"[WARN] Invalid quantity in kit: {norm_sku} requires {qty_per_kit} of {comp_sku}")
+                continue
+
+            if stock_qty is None:
+                logging.warning(f"[WARN] Missing stock data for component {comp_sku} in kit {norm_sku}")
+                stock_qty = 0
+
+            calculated_quantity = stock_qty // qty_per_kit
+            component_stocks.append((comp_sku, stock_qty, qty_per_kit, calculated_quantity))
+            calculated_quantities.append(calculated_quantity)
+
+        if not calculated_quantities:
+            logging.warning(f"[WARN] No valid components for virtual kit {norm_sku}. Skipping.")
+            return None
+
+        stock = min(calculated_quantities)
+        breakdown = ", ".join(f"{sku}: {stock_qty}/{qty_per_kit} → {possible}" 
+                              for sku, stock_qty, qty_per_kit, possible in component_stocks)
+        logging.info(f"[KIT CALC] {norm_sku}: available = {stock} (based on: {breakdown})")
+        return stock
+    except Exception as e:
+        logging.warning(f"[WARN] Error calculating virtual kit {norm_sku}: {e}")
+        return None
+
+def run_sync(stores=None, inv_data=None, kits=None, inflated_skus_store2=None, get_sku_map=None, client=None,
+             audit=None):
+    """
+    Pushes sheet stock (and virtual kit availability) to every configured store.
+
+    Everything is optional so a caller holding a warm gspread client, a fresh
+    inventory snapshot, kits, inflation rules or a cached catalog lookup
+    (get_sku_map(store) -> sku_map) can skip reloading them. Unless audit (or
+    CATALOG_AUDIT) is off, every store is crawled at once and audited first, and
+    the push uses those catalogs. Returns the number of SKUs processed.
+    """
+    if inv_data is None or kits is None:
+        client = client or get_gspread_client()
+        inv_data = load_inventory_from_sheets(client) if inv_data is None else inv_data
+        kits = load_kits_from_sheets(client) if kits is None else kits
+    if inflated_skus_store2 is None:
+        client = client or get_gspread_client()
+        inflated_skus_store2 = load_inflation_rules(client)
 
     all_skus = set(inv_data.keys()) | set(kits.keys())
     logging.info(f"[CALC] Processing {len(all_skus)} total SKUs")
 
-    for store in STORES:
+    stores = stores or load_store_configs()
+    audited_maps = {}
+    if audit is None:
+        audit = config.get_bool("CATALOG_AUDIT", True)
+    if audit:
+        # Imported here: catalog_audit imports this module for load_store_configs
+        import catalog_audit
+        try:
+            with profiling.timer("shopify.catalog_audit"):
+                audited_maps = catalog_audit.audit_before_sync(stores, inv_data, kits)
+        except Exception as e:
+            logging.error(f"[AUDIT] Catalog audit failed: {e}")
+
+    for store in stores:
         try:
             logging.info(f"[STORE SYNC] Syncing with {store['name']}")
-            sku_map = get_inventory_items(store)
+            requeued = []
+            # Crawled inside the per-store try, so one store's catalog error doesn't stop the others
+            sku_map = audited_maps.get(store["name"])
+            if sku_map is None:
+                sku_map = (get_sku_map or get_inventory_items)(store)
 
             for sku in all_skus:
                 norm_sku = sku.strip().upper()
                 stock = inv_data.get(norm_sku, {}).get("stock", 0)
 
                 if norm_sku in kits and norm_sku not in inv_data:
-                    components = kits[norm_sku]
-                    try:
-                        component_stocks = []
-                        calculated_quantities = []
-
-                        for comp in components:
-                            comp_sku = comp["sku"].strip().upper()
-                            qty_per_kit = comp["qty"]
-                            stock_qty = inv_data.get(comp_sku, {}).get("stock", 0)
-
-                            if qty_per_kit <= 0:
-                                logging.warning(f"[WARN] Invalid quantity in kit: {norm_sku} requires {qty_per_kit} of {comp_sku}")
-                                continue
-
-                            if stock_qty is None:
-                                logging.warning(f"[WARN] Missing stock data for component {comp_sku} in kit {norm_sku}")
-                                stock_qty = 0
-
-                            calculated_quantity = stock_qty // qty_per_kit
-                            component_stocks.append((comp_sku, stock_qty, qty_per_kit, calculated_quantity))
-                            calculated_quantities.append(calculated_quantity)
-
-                        if not calculated_quantities:
-                            logging.warning(f"[WARN] No valid components for virtual kit {norm_sku}. Skipping.")
-                            continue
-
-                        stock = min(calculated_quantities)
-                        breakdown = ", ".join(f"{sku}: {stock_qty}/{qty_per_kit} → {possible}" 
-                                              for sku, stock_qty, qty_per_kit, possible in component_stocks)
-                        logging.info(f"[KIT CALC] {norm_sku}: available = {stock} (based on: {breakdown})")
-                    except Exception as e:
-                        logging.warning(f"[WARN] Error calculating virtual kit {norm_sku}: {e}")
+                    stock = calculate_kit_stock(norm_sku, kits[norm_sku], inv_data)
+                    if stock is None:
                         continue
 
                     if store['name'] == "Store2" and norm_sku in inflated_skus_store2:
@@ -212,13 +247,40 @@ if __name__ == "__main__":
                 entry = sku_map.get(norm_sku)
                 if entry:
                     available = int(stock)
-                    update_inventory_level(store, norm_sku, entry["inventory_item_id"], available, name=entry["name"])
+                    try:
+                        update_inventory_level(store, norm_sku, entry["inventory_item_id"], available, name=entry["name"])
+                    except rate_governor.RateLimited as e:
+                        logging.warning(f"[RETRY] {e}; requeued")
+                        requeued.append((norm_sku, entry, available))
                 else:
                     logging.warning(f"[WARN] SKU {norm_sku} not found in {store['name']}")
 
+            # Throttled updates go again once the rest of the pass has let the bucket refill;
+            # one still throttled now fails the store loudly instead of being dropped
+            for norm_sku, entry, available in requeued:
+                update_inventory_level(store, norm_sku, entry["inventory_item_id"], available, name=entry["name"])
+
         except Exception as e:
             logging.error(f"[STORE ERROR] Failed to process {store['name']}: {e}")
 
     logging.info(f"[SUMMARY] Total SKUs processed: {len(all_skus)}")
     logging.info(f"[SUMMARY] Total kits detected: {len(kits)}")
+    rate_governor.log_stats()
+    return len(all_skus)
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    profiling.configure()
+    setup_logging()
+    dry_run = is_dry_run()
+    logging.info(f"[DEBUG] DRY_RUN = {dry_run}")
+
+    stores = load_store_configs()
+    if not stores:
+        logging.error("[ERROR] No valid Shopify store credentials found in .env")
+        sys.exit(1)
+
+    logging.info("[START] Shopify Inventory Sync" + (" [DRY-RUN]" if dry_run else ""))
+    with profiling.profile_run("shopify_sync"):
+        run_sync(stores)
     logging.info("[COMPLETE] Shopify sync finished")
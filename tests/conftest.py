@@ -0,0 +1,12 @@
+import sqlite3
+import pytest
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "order_log.db")
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
@@ -0,0 +1,64 @@
+from datetime import date
+from demand_rollup import get_velocity, rebuild_rollups, refresh_rollups
+from order_store import explode_order_items, init_order_lines, insert_order_lines
+
+KITS = {"KIT": [{"sku": "A", "qty": 2}, {"sku": "B", "qty": 1}]}
+INVENTORY = {"A": {}, "B": {}}
+
+def add_order(conn, order_id, day, items):
+    init_order_lines(conn)
+    insert_order_lines(conn, order_id, day, explode_order_items(items, KITS, INVENTORY))
+
+def rollups(conn):
+    return conn.execute("SELECT view, sku, day, qty FROM daily_sku_demand ORDER BY view, sku, day").fetchall()
+
+def test_refresh_rolls_up_both_views(conn):
+    add_order(conn, "o1", date(2026, 1, 1), [{"sku": "KIT", "quantity": 2}, {"sku": "A", "quantity": 1}])
+    add_order(conn, "o2", date(2026, 1, 1), [{"sku": "KIT", "quantity": 1}])
+    assert refresh_rollups(conn) == 5
+    assert rollups(conn) == [
+        ("component", "A", "2026-01-01", 7.0),
+        ("component", "B", "2026-01-01", 3.0),
+        ("ordered", "A", "2026-01-01", 1.0),
+        ("ordered", "KIT", "2026-01-01", 3.0),
+    ]
+    assert refresh_rollups(conn) == 0
+
+def test_incremental_refresh_matches_a_full_rebuild(conn):
+    add_order(conn, "o1", date(2026, 1, 1), [{"sku": "KIT", "quantity": 1}])
+    refresh_rollups(conn)
+    add_order(conn, "o2", date(2026, 1, 1), [{"sku": "A", "quantity": 4}])
+    add_order(conn, "o3", date(2026, 1, 2), [{"sku": "KIT", "quantity": 2}])
+    assert refresh_rollups(conn) == 3
+    incremental = rollups(conn)
+    rebuild_rollups(conn)
+    assert rollups(conn) == incremental
+
+def test_resynced_order_is_not_counted_twice(conn):
+    add_order(conn, "o1", date(2026, 1, 1), [{"sku": "KIT", "quantity": 1}, {"sku": "A", "quantity": 1}])
+    refresh_rollups(conn)
+    # Same order re-synced with a corrected ship date and quantity
+    add_order(conn, "o1", date(2026, 1, 3), [{"sku": "KIT", "quantity": 2}])
+    refresh_rollups(conn)
+    assert rollups(conn) == [
+        ("component", "A", "2026-01-03", 4.0),
+        ("component", "B", "2026-01-03", 2.0),
+        ("ordered", "KIT", "2026-01-03", 2.0),
+    ]
+    assert conn.execute("SELECT COUNT(*) FROM order_lines_replaced").fetchone()[0] == 0
+
+def test_lines_added_after_a_purge_are_still_rolled_up(conn):
+    add_order(conn, "o1", date(2026, 1, 1), [{"sku": "A", "quantity": 1}])
+    refresh_rollups(conn)
+    conn.execute("DELETE FROM order_lines")
+    conn.commit()
+    add_order(conn, "o2", date(2026, 1, 2), [{"sku": "A", "quantity": 5}])
+    assert refresh_rollups(conn) == 1
+    assert ("component", "A", "2026-01-02", 5.0) in rollups(conn)
+
+def test_velocity_averages_each_trailing_window(conn):
+    add_order(conn, "o1", date(2026, 1, 10), [{"sku": "A", "quantity": 7}])
+    add_order(conn, "o2", date(2026, 1, 1), [{"sku": "A", "quantity": 23}])
+    refresh_rollups(conn)
+    velocity = get_velocity(conn, "component", windows=(7, 30), as_of=date(2026, 1, 10))
+    assert velocity == {"A": {7: 1.0, 30: 1.0}}
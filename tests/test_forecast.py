@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from demand_rollup import init_rollups
+from forecast import bom_matrix, compute_forecasts, fit_models, load_demand_matrix
+
+AS_OF = date(2026, 3, 1)
+KITS = {"KIT": [{"sku": "a", "qty": 2}, {"sku": "B", "qty": 1}]}
+
+def add_demand(conn, view, sku, daily_qty):
+    """daily_qty[-1] lands on AS_OF, earlier entries on the days before it."""
+    init_rollups(conn)
+    start = AS_OF - timedelta(days=len(daily_qty) - 1)
+    conn.executemany(
+        "INSERT INTO daily_sku_demand (view, sku, day, qty) VALUES (?, ?, ?, ?)",
+        [(view, sku, (start + timedelta(days=i)).isoformat(), qty) for i, qty in enumerate(daily_qty) if qty]
+    )
+    conn.commit()
+
+def test_demand_matrix_fills_missing_days_with_zero(conn):
+    add_demand(conn, "ordered", "A", [3, 0, 5])
+    skus, Y = load_demand_matrix(conn, "ordered", days=4, as_of=AS_OF)
+    assert skus == ["A"]
+    assert Y.tolist() == [[0.0, 3.0, 0.0, 5.0]]
+
+def test_fit_models_picks_seasonal_naive_for_a_weekly_pattern():
+    week = [1, 1, 1, 1, 1, 10, 10]
+    Y = np.array([week * 4, [2.0] * 28])
+    models, forecast, sigma = fit_models(Y)
+    assert models.tolist() == ["seasonal_naive", "ses"]
+    assert forecast == pytest.approx([sum(week) / 7, 2.0])
+    assert sigma == pytest.approx([0.0, 0.0])
+
+def test_bom_matrix_skips_kits_that_are_stocked():
+    kits = {**KITS, "BOX": [{"sku": "A", "qty": 1}]}
+    B = bom_matrix(kits, {"BOX": {}}, ["KIT", "BOX"], ["A", "B"])
+    assert B.tolist() == [[2.0, 1.0], [0.0, 0.0]]
+
+def test_kit_forecasts_flow_through_to_components(conn, monkeypatch):
+    monkeypatch.setenv("FORECAST_HISTORY_DAYS", "28")
+    add_demand(conn, "ordered", "KIT", [1] * 28)
+    add_demand(conn, "ordered", "A", [2] * 28)
+    forecasts = compute_forecasts(conn, KITS, {"A": {}, "B": {}}, lead_time=10, z=2, as_of=AS_OF)
+
+    assert set(forecasts) == {"A", "B"}
+    assert forecasts["A"]["model"] == "ses"
+    assert forecasts["A"]["forecast_daily"] == pytest.approx(4.0)
+    assert forecasts["A"]["reorder_point"] == pytest.approx(40.0)
+    assert forecasts["B"]["model"] == "bom"
+    assert forecasts["B"]["forecast_daily"] == pytest.approx(1.0)
+
+def test_kit_variance_is_scaled_by_bom_quantity(conn, monkeypatch):
+    monkeypatch.setenv("FORECAST_HISTORY_DAYS", "28")
+    add_demand(conn, "ordered", "KIT", [0, 2] * 14)
+    forecasts = compute_forecasts(conn, KITS, {}, lead_time=4, z=1, as_of=AS_OF)
+    kit_sigma = forecasts["B"]["sigma_daily"]
+    assert kit_sigma > 0
+    assert forecasts["A"]["sigma_daily"] == pytest.approx(2 * kit_sigma)
+    assert forecasts["A"]["safety_stock"] == pytest.approx(2 * kit_sigma * 2)
@@ -0,0 +1,88 @@
+from datetime import datetime
+import pytest
+import inventory_ledger
+from inventory_ledger import flush, has_pending, last_event_id, overlay, record_event, record_events, stock_at
+
+class FakeSheet:
+    """Just enough of a gspread worksheet: SKU in column A, Stock On Hand in column C."""
+
+    def __init__(self, stock, on_read=None):
+        self.rows = [{"SKU": sku, "Stock On Hand": qty} for sku, qty in stock.items()]
+        self.on_read = on_read
+        self.fail_writes = False
+
+    def get_all_records(self):
+        records = [dict(row) for row in self.rows]
+        if self.on_read:
+            self.on_read()
+        return records
+
+    def batch_update(self, updates):
+        if self.fail_writes:
+            raise RuntimeError("sheet unavailable")
+        for update in updates:
+            self.rows[int(update["range"][1:]) - 2]["Stock On Hand"] = update["values"][0][0]
+
+    def stock(self):
+        return {row["SKU"]: row["Stock On Hand"] for row in self.rows}
+
+@pytest.fixture(autouse=True)
+def direct_sheets_calls(monkeypatch):
+    monkeypatch.setattr(inventory_ledger, "sheets_call", lambda func, *args, **kwargs: func(*args, **kwargs))
+
+def inventory(sheet):
+    return {sku: {"stock": float(qty)} for sku, qty in sheet.stock().items()}
+
+def test_flush_folds_pending_events_onto_sheet_values(db_path):
+    sheet = FakeSheet({"A": 10, "B": 3})
+    record_events([("a", "receive", 5), ("A", "ship", 2), ("B", "ship", 7)], db_path=db_path)
+    assert has_pending(db_path)
+
+    assert flush(sheet, db_path) == {"A": 13.0, "B": 0.0}
+    assert sheet.stock() == {"A": 13.0, "B": 0.0}
+    assert not has_pending(db_path)
+    assert flush(sheet, db_path) == {}
+
+def test_failed_write_releases_the_claim(db_path):
+    sheet = FakeSheet({"A": 10})
+    record_event("A", "receive", 1, db_path=db_path)
+    sheet.fail_writes = True
+    with pytest.raises(RuntimeError):
+        flush(sheet, db_path)
+    assert has_pending(db_path)
+
+    sheet.fail_writes = False
+    assert flush(sheet, db_path) == {"A": 11.0}
+
+def test_stock_at_includes_events_recorded_during_the_flush(db_path):
+    record_event("A", "set", 10, db_path=db_path)
+    sheet = FakeSheet({"A": 0}, on_read=lambda: record_event("A", "ship", 6, db_path=db_path))
+    assert flush(sheet, db_path) == {"A": 10.0}
+    # The ship landed after the sheet read: it isn't in the observed 10 and is still pending
+    assert stock_at("A", datetime.now(), db_path) == 4.0
+    assert has_pending(db_path)
+
+def test_stock_at_starts_from_the_last_absolute_event(db_path):
+    assert stock_at("A", datetime.now(), db_path) is None
+    record_events([("A", "receive", 4), ("A", "set", 2), ("A", "ship", 5), ("A", "adjust", 3)], db_path=db_path)
+    assert stock_at("a", datetime.now(), db_path) == 3.0
+
+def test_overlay_counts_each_event_once_around_a_flush(db_path):
+    sheet = FakeSheet({"A": 10})
+    record_event("A", "receive", 5, db_path=db_path)
+    stale = inventory(sheet)
+    stale_mark = last_event_id(db_path)
+    flush(sheet, db_path)
+    fresh = inventory(sheet)
+    fresh_mark = last_event_id(db_path)
+    record_event("A", "ship", 1, db_path=db_path)
+
+    # A read from before the flush still needs the flushed receive; one from after must not add it again
+    assert overlay(stale, mark=stale_mark, db_path=db_path)["A"]["stock"] == 14.0
+    assert overlay(fresh, mark=fresh_mark, db_path=db_path)["A"]["stock"] == 14.0
+    assert overlay(fresh, db_path=db_path)["A"]["stock"] == 14.0
+
+def test_overlay_returns_the_same_dict_when_nothing_applies(db_path):
+    record_event("ZZZ", "receive", 1, db_path=db_path)
+    stock = {"A": {"stock": 1.0}}
+    assert overlay(stock, db_path=db_path) is stock
@@ -0,0 +1,61 @@
+from datetime import date
+from order_store import explode_order_items, init_order_lines, insert_order_lines, lines_to_sku_changes
+
+KITS = {"KIT": [{"sku": "a", "qty": 2}, {"sku": "B", "qty": 1}]}
+INVENTORY = {"A": {}, "B": {}}
+
+def by_key(lines):
+    return {(line["sku"], line["kit_sku"]): line for line in lines}
+
+def test_standalone_items_are_normalized_and_aggregated():
+    lines = explode_order_items(
+        [{"sku": " a ", "quantity": 1}, {"sku": "A", "quantity": 2}, {"sku": "", "quantity": 5}, {"quantity": 1}],
+        KITS, INVENTORY
+    )
+    assert lines == [{"sku": "A", "kit_sku": "", "qty": 3, "kit_qty": None, "source": "standalone"}]
+
+def test_virtual_kit_is_exploded_into_components():
+    lines = by_key(explode_order_items([{"sku": "kit", "quantity": 3}, {"sku": "A", "quantity": 1}], KITS, INVENTORY))
+    assert lines[("A", "KIT")] == {"sku": "A", "kit_sku": "KIT", "qty": 6.0, "kit_qty": 3.0, "source": "kit"}
+    assert lines[("B", "KIT")]["qty"] == 3.0
+    assert lines[("A", "")]["qty"] == 1
+    assert lines_to_sku_changes(lines.values()) == {"A": 7.0, "B": 3.0}
+
+def test_kit_stocked_in_inventory_is_not_exploded():
+    lines = explode_order_items([{"sku": "KIT", "quantity": 2}], KITS, {**INVENTORY, "KIT": {}})
+    assert lines == [{"sku": "KIT", "kit_sku": "", "qty": 2, "kit_qty": None, "source": "standalone"}]
+
+def test_resync_replaces_lines_and_notes_the_replaced_keys(conn):
+    init_order_lines(conn)
+    lines = explode_order_items([{"sku": "KIT", "quantity": 1}], KITS, INVENTORY)
+    insert_order_lines(conn, "o1", date(2026, 1, 1), lines)
+    first_ids = [row[0] for row in conn.execute("SELECT id FROM order_lines")]
+    insert_order_lines(conn, "o1", date(2026, 1, 2), lines)
+
+    rows = conn.execute("SELECT id, sku, ship_date FROM order_lines ORDER BY sku").fetchall()
+    assert [(sku, day) for _, sku, day in rows] == [("A", "2026-01-02"), ("B", "2026-01-02")]
+    assert min(row[0] for row in rows) > max(first_ids)
+    replaced = conn.execute("SELECT sku, kit_sku, ship_date FROM order_lines_replaced ORDER BY sku").fetchall()
+    assert replaced == [("A", "KIT", "2026-01-01"), ("B", "KIT", "2026-01-01")]
+
+def test_ids_are_not_reused_after_the_table_is_emptied(conn):
+    init_order_lines(conn)
+    line = {"sku": "A", "kit_sku": "", "qty": 1, "kit_qty": None, "source": "standalone"}
+    insert_order_lines(conn, "o1", date(2026, 1, 1), [line])
+    old_id = conn.execute("SELECT id FROM order_lines").fetchone()[0]
+    conn.execute("DELETE FROM order_lines")
+    insert_order_lines(conn, "o2", date(2026, 1, 1), [line])
+    assert conn.execute("SELECT id FROM order_lines").fetchone()[0] > old_id
+
+def test_legacy_table_is_migrated_keeping_rowids(conn):
+    conn.execute("""
+        CREATE TABLE order_lines (
+            order_id TEXT NOT NULL, sku TEXT NOT NULL, kit_sku TEXT NOT NULL DEFAULT '',
+            qty REAL NOT NULL, kit_qty REAL, ship_date TEXT NOT NULL, source TEXT NOT NULL,
+            PRIMARY KEY (order_id, sku, kit_sku)
+        )
+    """)
+    conn.execute("INSERT INTO order_lines (rowid, order_id, sku, qty, ship_date, source) VALUES (7, 'o1', 'A', 1, '2026-01-01', 'standalone')")
+    conn.commit()
+    init_order_lines(conn)
+    assert conn.execute("SELECT id, order_id, sku FROM order_lines").fetchall() == [(7, "o1", "A")]